@@ -0,0 +1,194 @@
+import os
+import threading
+
+from flask import request, session
+
+from models import Group, Permission
+from store import STORAGE_BACKEND, problem_store
+
+PERMISSION_LEVELS = {
+    'read': 1,
+    'write': 2,
+    'admin': 3
+}
+# Levels granted by a problem itself rather than by sharing
+OWNER_LEVEL = PERMISSION_LEVELS['admin']
+GROUP_LEVEL = PERMISSION_LEVELS['read']
+PUBLIC_LEVEL = PERMISSION_LEVELS['read']
+
+ACL_FILES = ('data/permissions.json', 'data/groups.json')
+
+def _resource_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+class PermissionIndex:
+    """In-memory index of which user may access which problem
+
+    Explicit shares come from the permissions document; in addition a
+    problem's owner has admin access, members of its group can read it
+    when its visibility is 'group' and everyone can read public problems.
+    The documents are re-read only when they change on disk (or, with the
+    SQLite backend, when their version counter moves) or after
+    invalidate(); problem-derived grants follow store updates.
+    """
+
+    def __init__(self, store, backend=STORAGE_BACKEND):
+        self.store = store
+        self.backend = backend
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._shared = {}
+        self._member_of = {}
+        self._grants = {}
+        self._owned = {}
+        self._by_group = {}
+        self._public = set()
+        store.add_listener(self)
+
+    # Grants derived from the problems
+
+    def _grant(self, problem):
+        owner = problem.get('owner_id')
+        visibility = problem.get('visibility')
+        group_id = problem.get('group_id')
+        group = str(group_id) if visibility == 'group' and group_id not in (None, '') else None
+        return owner, group, visibility == 'public'
+
+    def _add(self, problem_id, grant):
+        owner, group, public = grant
+        self._grants[problem_id] = grant
+        if owner is not None:
+            self._owned.setdefault(owner, set()).add(problem_id)
+        if group is not None:
+            self._by_group.setdefault(group, set()).add(problem_id)
+        if public:
+            self._public.add(problem_id)
+
+    def _remove(self, problem_id):
+        grant = self._grants.pop(problem_id, None)
+        if grant is None:
+            return
+        owner, group, public = grant
+        for index, key in ((self._owned, owner), (self._by_group, group)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(problem_id)
+                if not ids:
+                    del index[key]
+        self._public.discard(problem_id)
+
+    def reset(self, problems):
+        with self._lock:
+            self._grants = {}
+            self._owned = {}
+            self._by_group = {}
+            self._public = set()
+            for problem in problems:
+                self._add(problem['id'], self._grant(problem))
+
+    def update(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._remove(old['id'])
+            if new is not None:
+                self._remove(new['id'])
+                self._add(new['id'], self._grant(new))
+
+    # Grants from the permissions and groups documents
+
+    def _documents_stamp(self):
+        if self.backend == 'sqlite':
+            return self.store.acl_version()
+        stamp = []
+        for path in ACL_FILES:
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _load_documents(self):
+        shared = {}
+        for resource_id, entries in Permission.load_permissions().items():
+            resource_id = _resource_id(resource_id)
+            for entry in entries:
+                level = PERMISSION_LEVELS.get(entry.get('permission_type'), 0)
+                grants = shared.setdefault(entry['user_id'], {})
+                if level > grants.get(resource_id, 0):
+                    grants[resource_id] = level
+        member_of = {}
+        for group in Group.load_groups()['groups']:
+            for member in set(group.get('members', [])) | {group.get('creator_id')}:
+                member_of.setdefault(member, set()).add(str(group['id']))
+        self._shared = shared
+        self._member_of = member_of
+
+    def _current(self):
+        self.store.refresh()
+        stamp = self._documents_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._load_documents()
+                self._stamp = stamp
+
+    def invalidate(self):
+        """Force the documents to be re-read (after share_problem or group changes)"""
+        with self._lock:
+            self._stamp = None
+
+    # Queries
+
+    def level(self, user_id, resource_id):
+        """The highest permission level user_id has on a problem (0 for none)"""
+        self._current()
+        with self._lock:
+            level = self._shared.get(user_id, {}).get(resource_id, 0)
+            grant = self._grants.get(resource_id)
+            if grant is None:
+                return level
+            owner, group, public = grant
+            if owner is not None and owner == user_id:
+                level = max(level, OWNER_LEVEL)
+            if group is not None and group in self._member_of.get(user_id, ()):
+                level = max(level, GROUP_LEVEL)
+            if public:
+                level = max(level, PUBLIC_LEVEL)
+            return level
+
+    def accessible_ids(self, user_id, required_permission='read'):
+        """Set of problem ids user_id has at least required_permission on"""
+        required = PERMISSION_LEVELS[required_permission]
+        self._current()
+        with self._lock:
+            ids = {resource_id for resource_id, level in self._shared.get(user_id, {}).items()
+                   if level >= required}
+            if OWNER_LEVEL >= required:
+                ids |= self._owned.get(user_id, set())
+            if GROUP_LEVEL >= required:
+                for group in self._member_of.get(user_id, ()):
+                    ids |= self._by_group.get(group, set())
+            if PUBLIC_LEVEL >= required:
+                ids |= self._public
+            return ids
+
+    def filter_accessible(self, user_id, ids, required_permission='read'):
+        """The subset of ids user_id has at least required_permission on"""
+        return self.accessible_ids(user_id, required_permission).intersection(ids)
+
+permission_index = PermissionIndex(problem_store)
+
+def is_admin():
+    """Whether the current request is made by an admin (token or session)"""
+    if hasattr(request, 'is_admin'):
+        return request.is_admin
+    return bool(session.get('is_admin'))
+
+def has_permission(user_id, resource_id, required_permission):
+    """Check if user has required permission"""
+    if is_admin():
+        return True
+    return permission_index.level(user_id, resource_id) >= PERMISSION_LEVELS[required_permission]
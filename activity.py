@@ -0,0 +1,170 @@
+"""Append-only stream of everything that happened to the problems
+
+Every committed mutation appends one event per new history entry (plus
+one for a deleted problem) to data/activity.ndjson. Events are numbered
+by seq in commit order; the writer lock of the store makes the numbering
+consistent across processes. Readers keep the byte offset of each event
+and posting lists per problem, user and action, so a page costs
+O(page size) file reads however long the history is.
+"""
+import bisect
+import json
+import os
+import threading
+from datetime import datetime
+
+ACTIVITY_FILE = 'data/activity.ndjson'
+
+# Filters supported by page(), by event field
+FILTERS = ('problem_id', 'user', 'action')
+
+def _contains(seqs, seq):
+    i = bisect.bisect_left(seqs, seq)
+    return i < len(seqs) and seqs[i] == seq
+
+def _events(problem, entries):
+    for entry in entries:
+        yield {
+            'problem_id': problem['id'],
+            'problem_title': problem.get('title'),
+            'date': entry.get('date'),
+            'action': entry.get('action'),
+            'details': entry.get('details'),
+            'user': entry.get('user')
+        }
+
+def change_events(old, new):
+    """Events for one (old, new) change: new history entries or a deletion"""
+    if new is None:
+        if old is None:
+            return []
+        return [{
+            'problem_id': old['id'],
+            'problem_title': old.get('title'),
+            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'action': 'deleted',
+            'details': 'הבעיה נמחקה',
+            'user': None
+        }]
+    seen = len(old.get('history', [])) if old else 0
+    return list(_events(new, new.get('history', [])[seen:]))
+
+class ActivityStream:
+    """Reader and (through a store commit hook) writer of the activity file"""
+
+    def __init__(self, store, path=ACTIVITY_FILE):
+        self.store = store
+        self.path = path
+        self._lock = threading.RLock()
+        self._offsets = []
+        self._read_offset = 0
+        self._inode = None
+        self._postings = {name: {} for name in FILTERS}
+        self._seed()
+        store.add_commit_hook(self.record)
+
+    def _seed(self):
+        """Create the stream from the existing problem histories, once"""
+        if os.path.exists(self.path):
+            return
+        events = []
+        for problem in self.store.problems():
+            events.extend(_events(problem, problem.get('history', [])))
+        events.sort(key=lambda event: event['date'] or '')
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for seq, event in enumerate(events, start=1):
+                f.write(json.dumps({'seq': seq, **event}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            # Fails if another process seeded the stream first
+            os.link(tmp_path, self.path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def _index(self, event, offset):
+        seq = event['seq']
+        if seq != len(self._offsets) + 1:
+            raise ValueError(f'Activity stream out of order at seq {seq}')
+        self._offsets.append(offset)
+        for name in FILTERS:
+            value = event.get(name)
+            if value is not None:
+                self._postings[name].setdefault(value, []).append(seq)
+
+    def _sync(self):
+        """Index events appended since the last call (by any process)"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self._inode:
+            self._offsets = []
+            self._read_offset = 0
+            self._postings = {name: {} for name in FILTERS}
+            self._inode = st.st_ino
+        if st.st_size <= self._read_offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._read_offset)
+            offset = self._read_offset
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self._index(json.loads(line), offset)
+                offset += len(line)
+            self._read_offset = offset
+
+    def record(self, changes):
+        """Commit hook: append the events of a committed mutation"""
+        events = [event for old, new in changes for event in change_events(old, new)]
+        if not events:
+            return
+        with self._lock:
+            self._sync()
+            lines = []
+            for seq, event in enumerate(events, start=len(self._offsets) + 1):
+                lines.append(json.dumps({'seq': seq, **event}, ensure_ascii=False) + '\n')
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+            self._sync()
+
+    def _read(self, seqs):
+        events = []
+        with open(self.path, 'rb') as f:
+            for seq in seqs:
+                f.seek(self._offsets[seq - 1])
+                events.append(json.loads(f.readline()))
+        return events
+
+    def page(self, limit=50, before=None, **filters):
+        """Return up to limit events older than seq before, newest first
+
+        filters may restrict problem_id, user and action. Returns
+        (events, next_before), next_before being None on the last page.
+        """
+        with self._lock:
+            self._sync()
+            last = len(self._offsets) if before is None else min(before - 1, len(self._offsets))
+            lists = [self._postings[name].get(value, []) for name, value in filters.items()
+                     if value is not None]
+            if not lists:
+                seqs = list(range(last, max(last - limit, 0), -1))
+                more = last - limit > 0
+            else:
+                lists.sort(key=len)
+                shortest, others = lists[0], lists[1:]
+                seqs = []
+                i = bisect.bisect_right(shortest, last) - 1
+                while i >= 0 and len(seqs) <= limit:
+                    seq = shortest[i]
+                    if all(_contains(other, seq) for other in others):
+                        seqs.append(seq)
+                    i -= 1
+                more = len(seqs) > limit
+                seqs = seqs[:limit]
+            events = self._read(seqs)
+        return events, (seqs[-1] if more and seqs else None)
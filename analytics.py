@@ -0,0 +1,264 @@
+"""Columnar snapshot of the problems for vectorized reporting
+
+Each problem occupies one row of a set of NumPy arrays: status and
+category as integer codes, created/due/closed dates as day ordinals,
+month codes and a complexity score. Rows are updated in place
+from store notifications; deleted rows are masked out and reused. The
+report functions are a handful of array operations instead of loops over
+dicts with date parsing.
+"""
+import threading
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+# Marks a missing date in the ordinal columns
+NO_DATE = -1
+INITIAL_CAPACITY = 1024
+
+COLUMNS = {
+    'title': object,
+    'status': np.int32,
+    'category': np.int32,
+    'created': np.int64,
+    'due': np.int64,
+    'closed': np.int64,
+    'month': np.int32,
+    'complexity': np.float64,
+    'alive': np.bool_,
+}
+
+@lru_cache(maxsize=4096)
+def _day(text):
+    try:
+        return date.fromisoformat(text).toordinal()
+    except ValueError:
+        return NO_DATE
+
+def _ordinal(text):
+    return _day(text[:10]) if isinstance(text, str) else NO_DATE
+
+def _month(text):
+    try:
+        return int(text[:4]) * 12 + int(text[5:7]) - 1
+    except (TypeError, ValueError):
+        return -1
+
+def _is_closing(entry):
+    if entry.get('action') != 'status_changed':
+        return False
+    details = entry.get('details', '')
+    return 'סגור' in details or details.endswith('ל-closed')
+
+def closed_ordinal(problem):
+    """Day the problem was last closed, from its history"""
+    entry = next((h for h in reversed(problem.get('history', [])) if _is_closing(h)), None)
+    return _ordinal(entry['date']) if entry else NO_DATE
+
+def complexity(problem):
+    return (len(problem.get('subtasks', [])) * 2
+            + len(problem.get('comments', []))
+            + len(problem.get('time_logs', [])) * 0.5)
+
+class Codes:
+    """Dictionary encoding of a categorical column"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+class AnalyticsSnapshot:
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._clear()
+        store.add_listener(self)
+
+    def _clear(self, columns=None):
+        if columns is None:
+            columns = {name: np.zeros(INITIAL_CAPACITY, dtype) for name, dtype in COLUMNS.items()}
+        self._columns = columns
+        self._size = 0
+        self._rows = {}
+        self._free = []
+        self._status = Codes()
+        self._category = Codes()
+        self._tag_usage = Counter()
+        self._effectiveness = {}
+
+    def _grow(self):
+        for name, column in self._columns.items():
+            grown = np.zeros(len(column) * 2, column.dtype)
+            grown[:len(column)] = column
+            self._columns[name] = grown
+
+    def _row(self, problem_id):
+        row = self._rows.get(problem_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == len(self._columns['alive']):
+                    self._grow()
+                row = self._size
+                self._size += 1
+            self._rows[problem_id] = row
+        return row
+
+    def _values(self, problem):
+        """The column values of a problem, in COLUMNS order"""
+        self._tag_usage.update(problem.get('tags', []))
+        # A problem's effectiveness is that of its last implemented solution
+        implemented = [s for s in problem.get('solutions', []) if s.get('implemented')]
+        if implemented:
+            self._effectiveness[problem['id']] = implemented[-1].get('effectiveness', 0)
+        return (
+            problem.get('title'),
+            self._status.code(problem.get('status')),
+            self._category.code(problem.get('category')),
+            _ordinal(problem.get('created_date')),
+            _ordinal(problem.get('due_date')),
+            closed_ordinal(problem),
+            _month(problem.get('created_date')),
+            complexity(problem),
+            True
+        )
+
+    def _set(self, problem):
+        row = self._row(problem['id'])
+        for column, value in zip(self._columns.values(), self._values(problem)):
+            column[row] = value
+
+    def _unset(self, problem):
+        row = self._rows.pop(problem['id'], None)
+        if row is None:
+            return
+        self._columns['alive'][row] = False
+        self._columns['title'][row] = None
+        self._free.append(row)
+        for tag in problem.get('tags', []):
+            self._tag_usage[tag] -= 1
+            if self._tag_usage[tag] <= 0:
+                del self._tag_usage[tag]
+        self._effectiveness.pop(problem['id'], None)
+
+    def reset(self, problems):
+        with self._lock:
+            self._clear()
+            rows = [self._values(problem) for problem in problems]
+            capacity = INITIAL_CAPACITY
+            while capacity < len(rows):
+                capacity *= 2
+            for (name, dtype), values in zip(COLUMNS.items(), zip(*rows) if rows else [()] * len(COLUMNS)):
+                column = np.zeros(capacity, dtype)
+                column[:len(rows)] = values
+                self._columns[name] = column
+            self._rows = {problem['id']: row for row, problem in enumerate(problems)}
+            self._size = len(rows)
+
+    def update(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._unset(old)
+            if new is not None:
+                self._set(new)
+
+    def _view(self, *names):
+        """The live rows of the given columns"""
+        alive = self._columns['alive'][:self._size]
+        return {name: self._columns[name][:self._size][alive] for name in names}
+
+    def report_metrics(self, today=None):
+        """The metrics of the /reports page"""
+        today = (today or date.today()).toordinal()
+        self.store.refresh()
+        with self._lock:
+            cols = self._view('status', 'category', 'created', 'due', 'closed', 'month')
+            total = len(cols['status'])
+            is_closed = cols['status'] == self._status.codes.get('closed', -1)
+
+            metrics = {
+                'total_problems': total,
+                'avg_resolution_time': 0,
+                'overdue_percentage': 0,
+                'completion_rate': 0,
+                'category_distribution': {},
+                'monthly_trends': {},
+                'tag_usage': dict(self._tag_usage),
+                'solution_effectiveness': {}
+            }
+            if not total:
+                return metrics
+
+            resolved = is_closed & (cols['closed'] != NO_DATE) & (cols['created'] != NO_DATE)
+            if resolved.any():
+                metrics['avg_resolution_time'] = float((cols['closed'][resolved] - cols['created'][resolved]).mean())
+
+            overdue = (cols['due'] != NO_DATE) & (cols['due'] < today) & ~is_closed
+            metrics['overdue_percentage'] = float(overdue.sum()) / total * 100
+            metrics['completion_rate'] = float(is_closed.sum()) / total * 100
+
+            metrics['category_distribution'] = self._distribution(self._category, cols['category'])
+            metrics['monthly_trends'] = self._months(cols['month'])
+
+            metrics['solution_effectiveness'] = dict(self._effectiveness)
+            return metrics
+
+    def advanced_metrics(self):
+        """The metrics of the /advanced_reports page (without tag correlations)"""
+        self.store.refresh()
+        with self._lock:
+            cols = self._view('title', 'status', 'category', 'created', 'closed', 'month', 'complexity')
+            is_closed = cols['status'] == self._status.codes.get('closed', -1)
+
+            metrics = {
+                'resolution_times': [],
+                'category_success_rates': {},
+                'tag_correlations': {},
+                'monthly_workload': self._months(cols['month']),
+                'problem_complexity': {}
+            }
+
+            resolved = is_closed & (cols['closed'] != NO_DATE) & (cols['created'] != NO_DATE)
+            days = cols['closed'][resolved] - cols['created'][resolved]
+            categories = self._category.values
+            for title, row_days, category in zip(cols['title'][resolved].tolist(), days.tolist(),
+                                                 cols['category'][resolved].tolist()):
+                metrics['resolution_times'].append({
+                    'problem': title,
+                    'days': row_days,
+                    'category': categories[category]
+                })
+
+            totals = np.bincount(cols['category'], minlength=len(categories))
+            solved = np.bincount(cols['category'][is_closed], minlength=len(categories))
+            for code in np.flatnonzero(totals).tolist():
+                metrics['category_success_rates'][categories[code]] = {
+                    'total': int(totals[code]),
+                    'solved': int(solved[code])
+                }
+
+            metrics['problem_complexity'] = dict(zip(cols['title'].tolist(), cols['complexity'].tolist()))
+            return metrics
+
+    def _distribution(self, codes, column):
+        counts = np.bincount(column, minlength=len(codes.values))
+        return {codes.values[code]: int(counts[code]) for code in np.flatnonzero(counts).tolist()}
+
+    def _months(self, column):
+        column = column[column >= 0]
+        if not len(column):
+            return {}
+        first = int(column.min())
+        counts = np.bincount(column - first)
+        return {f'{month // 12:04d}-{month % 12 + 1:02d}': int(counts[month - first])
+                for month in (np.flatnonzero(counts) + first).tolist()}
@@ -1,37 +1,96 @@
 from flask import Blueprint, jsonify, request
-from auth import login_required
+from auth import token_required, generate_token
+from werkzeug.security import check_password_hash
 from models import User, Permission
+from store import problem_store
+from acl import has_permission, is_admin, permission_index
+from pagination import PaginationError, page_from_args, parse_fields, project
 import json
 
 api = Blueprint('api', __name__)
 
+@api.route('/api/token', methods=['POST'])
+def issue_token():
+    """
+    Exchange a username and password for an API token
+    ---
+    tags:
+      - Auth
+    parameters:
+      - name: username
+        in: formData
+        type: string
+        required: true
+      - name: password
+        in: formData
+        type: string
+        required: true
+    responses:
+      200:
+        description: Bearer token valid for one day
+      401:
+        description: Wrong username or password
+    """
+    data = request.get_json(silent=True) or request.form
+    username = data.get('username', '')
+    password = data.get('password', '')
+    
+    user = User.load_users().get(username)
+    if not user or not check_password_hash(user['password_hash'], password):
+        return jsonify({'error': 'Invalid credentials'}), 401
+    
+    token = generate_token(username, is_admin=user.get('role') == 'admin')
+    return jsonify({'token': token, 'token_type': 'Bearer'})
+
 @api.route('/api/problems', methods=['GET'])
-@login_required
+@token_required
 def get_problems():
     """
-    Get all problems accessible to the user
+    Get a page of the problems accessible to the user
     ---
     tags:
       - Problems
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        description: Page size (default 50, at most 500)
+      - name: cursor
+        in: query
+        type: string
+        description: next_cursor of the previous page
+      - name: sort
+        in: query
+        type: string
+        description: id, title, category, status, created_date, due_date or total_time; prefix with - for descending
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated fields to return (id is always included)
     security:
       - Bearer: []
     responses:
       200:
-        description: List of problems
+        description: Page of problems with the cursor of the next page
+      400:
+        description: Invalid pagination arguments
     """
     user_id = request.user_id
-    problems = load_problems()
     
     # Filter problems based on permissions
-    accessible_problems = [
-        p for p in problems['problems']
-        if has_permission(user_id, p['id'], 'read')
-    ]
+    if is_admin():
+        accessible_problems = problem_store.problems()
+    else:
+        accessible = permission_index.accessible_ids(user_id, 'read')
+        accessible_problems = (p for p in problem_store.problems() if p['id'] in accessible)
     
-    return jsonify(accessible_problems)
+    try:
+        return jsonify(page_from_args(accessible_problems, request.args, always=True))
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
 
 @api.route('/api/problems/<int:problem_id>', methods=['GET'])
-@login_required
+@token_required
 def get_problem(problem_id):
     """
     Get a specific problem
@@ -43,6 +102,10 @@ def get_problem(problem_id):
         in: path
         type: integer
         required: true
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated fields to return (id is always included)
     security:
       - Bearer: []
     responses:
@@ -56,15 +119,11 @@ def get_problem(problem_id):
     if not has_permission(user_id, problem_id, 'read'):
         return jsonify({'error': 'Access denied'}), 403
     
-    problems = load_problems()
-    problem = next(
-        (p for p in problems['problems'] if p['id'] == problem_id),
-        None
-    )
+    problem = problem_store.get(problem_id)
     
     if not problem:
         return jsonify({'error': 'Problem not found'}), 404
     
-    return jsonify(problem)
+    return jsonify(project(problem, parse_fields(request.args)))
 
 # Add more API endpoints... 
\ No newline at end of file
@@ -1,21 +1,42 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash, session
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash, session, Response, stream_with_context
 import json
 from datetime import datetime, timedelta
 import os
-import threading
-import schedule
-import time
-import pandas as pd
-from io import BytesIO
 import pytz
 from weasyprint import HTML
 import calendar
 from auth import login_required, admin_required, generate_token, verify_token
 from models import User, Permission, Group
-from backup import start_backup_scheduler
+from backup import create_backup
 from api import api
+from store import STORAGE_BACKEND, atomic_write_json, problem_store
+from search import SearchIndex
+from tags import TagCooccurrence, TagDictionary
+from stats import ProblemStats
+from due_index import DueDateIndex
+from export import EXPORT_FORMATS, STREAM_WRITERS, export_stream
+from export_jobs import ExportJobs
+from pagination import PaginationError, page_from_args
+from acl import permission_index
+from activity import ActivityStream
+from notifications import NotificationFeed
+from report_cache import ReportCache
+from analytics import AnalyticsSnapshot
+from reminders import ReminderScheduler
+from mailer import Mailer
+from scheduler import Scheduler
 
 app = Flask(__name__)
+app.register_blueprint(api)
+search_index = SearchIndex(problem_store)
+tag_dictionary = TagDictionary(problem_store)
+tag_cooccurrence = TagCooccurrence(problem_store)
+due_index = DueDateIndex(problem_store)
+problem_stats_counters = ProblemStats(problem_store, due_index)
+export_jobs = ExportJobs(problem_store, STORAGE_BACKEND)
+notification_feed = NotificationFeed(problem_store)
+report_cache = ReportCache(problem_store)
+analytics = AnalyticsSnapshot(problem_store)
 
 # Ensure data directory exists
 if not os.path.exists('data'):
@@ -23,54 +44,48 @@ if not os.path.exists('data'):
 
 # Initialize problems.json if it doesn't exist
 if not os.path.exists('data/problems.json'):
-    with open('data/problems.json', 'w') as f:
-        json.dump({"problems": []}, f)
+    atomic_write_json('data/problems.json', {"problems": []})
 
-def load_problems():
-    with open('data/problems.json', 'r') as f:
-        return json.load(f)
-
-def save_problems(problems):
-    with open('data/problems.json', 'w') as f:
-        json.dump(problems, f, indent=4)
-
-def send_reminder_email(problem):
-    # TODO: Implement actual email sending
-    print(f"Sending reminder for problem: {problem['title']}")
+ACTIVITY_PAGE_SIZE = 50
+activity_stream = ActivityStream(problem_store)
 
-def check_reminders():
-    problems = load_problems()['problems']
-    today = datetime.now().date()
-    
-    for problem in problems:
-        due_date = datetime.strptime(problem['due_date'], '%Y-%m-%d').date()
-        days_until_due = (due_date - today).days
-        
-        if days_until_due in [7, 3, 1] and problem['status'] != 'closed':
-            send_reminder_email(problem)
+mailer = Mailer()
 
-# Start reminder checker in background
-def run_schedule():
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
-
-schedule.every().day.at("09:00").do(check_reminders)
-reminder_thread = threading.Thread(target=run_schedule, daemon=True)
-reminder_thread.start()
+def send_reminder_emails(reminders):
+    """Queue a reminder email to the owner of each problem"""
+    users = User.load_users()
+    for problem, days_before in reminders:
+        email = users.get(problem.get('owner_id'), {}).get('email')
+        if not email:
+            continue
+        mailer.send(email,
+                    f'תזכורת: {problem["title"]}',
+                    f'נותרו {days_before} ימים לסיום הבעיה "{problem["title"]}" (תאריך יעד: {problem["due_date"]})')
+
+reminder_scheduler = ReminderScheduler(problem_store, send_reminder_emails)
+
+scheduler = Scheduler()
+# Send the reminders that came due
+scheduler.register('reminders', scheduler.every(1).minutes, reminder_scheduler.run_due, shared=True)
+# Fold the mutation journal back into data/problems.json
+scheduler.register('compact', scheduler.every(10).minutes, problem_store.compact, shared=True)
+# Incremental snapshot of data/ (retention tiers thin them out)
+scheduler.register('backup', scheduler.every(1).hours, create_backup, shared=True)
+# Keep the notification feeds current
+scheduler.register('notifications', scheduler.every(1).minutes, notification_feed.materialize)
+# Recompute reports after changes so page views find them warm
+scheduler.register('reports', scheduler.every(1).minutes, report_cache.refresh)
+scheduler.start()
 
 @app.route('/')
 def dashboard():
-    problems = load_problems()
-    return render_template('dashboard.html', problems=problems['problems'])
+    return render_template('dashboard.html', problems=problem_store.problems())
 
 @app.route('/add_problem', methods=['GET', 'POST'])
 @login_required
 def add_problem():
     if request.method == 'POST':
-        data = load_problems()
         new_problem = {
-            'id': len(data['problems']) + 1,
             'title': request.form['title'],
             'category': request.form['category'],
             'description': request.form['description'],
@@ -84,27 +99,24 @@ def add_problem():
             'history': [{
                 'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'action': 'created',
-                'details': 'בעיה נוצרה'
+                'details': 'בעיה נוצרה',
+                'user': session.get('user_id')
             }]
         }
-        data['problems'].append(new_problem)
-        save_problems(data)
-        return jsonify({'success': True})
+        problem_store.insert(new_problem)
+        return jsonify({'success': True, 'id': new_problem['id']})
     
     user_groups = Group.load_user_groups(session['user_id'])
     return render_template('problem_form.html', groups=user_groups)
 
 @app.route('/delete_problem/<int:problem_id>', methods=['POST'])
 def delete_problem(problem_id):
-    data = load_problems()
-    data['problems'] = [p for p in data['problems'] if p['id'] != problem_id]
-    save_problems(data)
+    problem_store.delete(problem_id)
     return jsonify({'success': True})
 
 @app.route('/edit_problem/<int:problem_id>', methods=['GET', 'POST'])
 def edit_problem(problem_id):
-    data = load_problems()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = problem_store.get(problem_id)
     
     if request.method == 'POST':
         old_status = problem['status']
@@ -114,26 +126,21 @@ def edit_problem(problem_id):
         history_entry = {
             'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'action': 'edited',
-            'details': f'שדות שעודכנו: {", ".join(request.form.keys())}'
+            'details': f'שדות שעודכנו: {", ".join(request.form.keys())}',
+            'user': session.get('user_id')
         }
         
         if old_status != new_status:
             history_entry['details'] = f'סטטוס שונה מ-{old_status} ל-{new_status}'
         
-        problem.update({
+        problem_store.update(problem_id, {
             'title': request.form['title'],
             'category': request.form['category'],
             'description': request.form['description'],
             'status': new_status,
             'due_date': request.form['due_date'],
             'tags': request.form.getlist('tags')
-        })
-        
-        if 'history' not in problem:
-            problem['history'] = []
-        problem['history'].append(history_entry)
-        
-        save_problems(data)
+        }, history=history_entry)
         return jsonify({'success': True})
     
     return render_template('problem_form.html', problem=problem, edit_mode=True)
@@ -142,107 +149,89 @@ def edit_problem(problem_id):
 def filter_problems():
     category = request.args.get('category')
     status = request.args.get('status')
-    search = request.args.get('search', '').lower()
+    search = request.args.get('search', '')
     
-    problems = load_problems()['problems']
+    problems = problem_store.query(
+        category=category if category and category != 'all' else None,
+        status=status if status and status != 'all' else None
+    )
     
-    if category and category != 'all':
-        problems = [p for p in problems if p['category'] == category]
-    if status and status != 'all':
-        problems = [p for p in problems if p['status'] == status]
+    scores = None
     if search:
-        problems = [p for p in problems if search in p['title'].lower() or search in p['description'].lower()]
+        problems, scores = rank_by_search(problems, search)
     
-    return jsonify(problems)
+    return problems_response(problems, scores)
+
+def rank_by_search(problems, query):
+    """Keep the problems matching a full-text query, best matches first
+
+    Returns the matching problems and a {problem_id: score} dict.
+    """
+    scores = dict(search_index.search(query))
+    matching = [p for p in problems if p['id'] in scores]
+    matching.sort(key=lambda p: (-scores[p['id']], p['id']))
+    return matching, scores
+
+def problems_response(problems, scores=None):
+    """jsonify problems, paginated and projected if the request asks for it"""
+    try:
+        return jsonify(page_from_args(problems, request.args, scores))
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/problem_stats')
 def problem_stats():
-    problems = load_problems()['problems']
-    
-    total = len(problems)
-    by_status = {}
-    by_category = {}
-    overdue = 0
-    total_time_spent = 0
-    today = datetime.now().date()
-    
-    for problem in problems:
-        # Status stats
-        status = problem['status']
-        by_status[status] = by_status.get(status, 0) + 1
-        
-        # Category stats
-        category = problem['category']
-        by_category[category] = by_category.get(category, 0) + 1
-        
-        # Overdue problems
-        due_date = datetime.strptime(problem['due_date'], '%Y-%m-%d').date()
-        if due_date < today and problem['status'] != 'closed':
-            overdue += 1
-            
-        # Add time tracking stats
-        total_time_spent += problem.get('total_time', 0)
-    
-    return jsonify({
-        'total': total,
-        'by_status': by_status,
-        'by_category': by_category,
-        'overdue': overdue,
-        'total_time_spent': total_time_spent,
-        'avg_time_per_problem': total_time_spent / total if total > 0 else 0
-    })
+    return jsonify(problem_stats_counters.snapshot())
+
+@app.route('/scheduler_status')
+@admin_required
+def scheduler_status():
+    """Execution metrics of the periodic jobs in this process"""
+    return jsonify(scheduler.metrics())
 
 @app.route('/add_subtask/<int:problem_id>', methods=['POST'])
 def add_subtask(problem_id):
-    data = load_problems()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = problem_store.get(problem_id)
     
     if problem:
         new_subtask = {
-            'id': len(problem.get('subtasks', [])) + 1,
             'title': request.form['title'],
             'status': 'pending',
             'created_date': datetime.now().strftime('%Y-%m-%d'),
             'completed_date': None
         }
         
-        if 'subtasks' not in problem:
-            problem['subtasks'] = []
-        
-        problem['subtasks'].append(new_subtask)
-        
         # Add to history
         history_entry = {
             'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'action': 'subtask_added',
-            'details': f'נוספה משימת משנה: {new_subtask["title"]}'
+            'details': f'נוספה משימת משנה: {new_subtask["title"]}',
+            'user': session.get('user_id')
         }
-        problem['history'].append(history_entry)
-        
-        save_problems(data)
+        problem_store.append(problem_id, 'subtasks', new_subtask, history=history_entry)
         return jsonify({'success': True, 'subtask': new_subtask})
     
     return jsonify({'success': False}), 404
 
 @app.route('/toggle_subtask/<int:problem_id>/<int:subtask_id>', methods=['POST'])
 def toggle_subtask(problem_id, subtask_id):
-    data = load_problems()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = problem_store.get(problem_id)
     
     if problem and 'subtasks' in problem:
         subtask = next((s for s in problem['subtasks'] if s['id'] == subtask_id), None)
         if subtask:
-            subtask['status'] = 'completed' if subtask['status'] == 'pending' else 'pending'
-            subtask['completed_date'] = datetime.now().strftime('%Y-%m-%d') if subtask['status'] == 'completed' else None
-            
-            save_problems(data)
+            new_status = 'completed' if subtask['status'] == 'pending' else 'pending'
+            problem_store.update_item(problem_id, 'subtasks', subtask_id, {
+                'status': new_status,
+                'completed_date': datetime.now().strftime('%Y-%m-%d') if new_status == 'completed' else None
+            })
             return jsonify({'success': True})
     
     return jsonify({'success': False}), 404
 
 @app.route('/timeline')
 def timeline():
-    problems = load_problems()['problems']
+    problems = problem_store.problems()
     timeline_data = []
     
     for problem in problems:
@@ -259,125 +248,97 @@ def timeline():
 
 @app.route('/export/<format>')
 def export_data(format):
-    problems = load_problems()['problems']
-    
-    if format == 'excel':
-        # Create a more detailed Excel report
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            # Problems sheet
-            df_problems = pd.DataFrame(problems)
-            df_problems.to_excel(writer, sheet_name='Problems', index=False)
-            
-            # Solutions sheet
-            solutions_data = []
-            for problem in problems:
-                for solution in problem.get('solutions', []):
-                    solution_data = {
-                        'problem_id': problem['id'],
-                        'problem_title': problem['title'],
-                        **solution
-                    }
-                    solutions_data.append(solution_data)
-            
-            if solutions_data:
-                df_solutions = pd.DataFrame(solutions_data)
-                df_solutions.to_excel(writer, sheet_name='Solutions', index=False)
-            
-            # Time logs sheet
-            time_logs_data = []
-            for problem in problems:
-                for log in problem.get('time_logs', []):
-                    log_data = {
-                        'problem_id': problem['id'],
-                        'problem_title': problem['title'],
-                        **log
-                    }
-                    time_logs_data.append(log_data)
-            
-            if time_logs_data:
-                df_time_logs = pd.DataFrame(time_logs_data)
-                df_time_logs.to_excel(writer, sheet_name='Time Logs', index=False)
-            
-            # Add some basic charts
-            workbook = writer.book
-            problems_sheet = writer.sheets['Problems']
-            
-            # Status distribution pie chart
-            status_counts = df_problems['status'].value_counts()
-            chart1 = workbook.add_chart({'type': 'pie'})
-            chart1.add_series({
-                'categories': ['Problems', 1, 0, len(status_counts), 0],
-                'values': ['Problems', 1, 1, len(status_counts), 1],
-                'name': 'Status Distribution'
-            })
-            problems_sheet.insert_chart('K2', chart1)
-        
-        output.seek(0)
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name='problems_detailed_export.xlsx'
+    """Download an export: a cached artifact, a streamed CSV/NDJSON, or else start a job"""
+    if format not in EXPORT_FORMATS:
+        return jsonify({'error': 'Invalid format'}), 400
+    
+    extension, mimetype = EXPORT_FORMATS[format]
+    # Unchanged data: serve the artifact of an earlier export job
+    path = export_jobs.cached(format)
+    if not path and format in STREAM_WRITERS:
+        # CSV and NDJSON are generated row by row straight into the response
+        chunks, mimetype, filename = export_stream(problem_store, format)
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
-    
-    return jsonify({'error': 'Invalid format'}), 400
+    if not path:
+        # Generated in the background: continue with /export_jobs/<id>
+        job = export_jobs.submit(format)
+        return jsonify({'success': True, 'job': job}), 202
+    
+    return send_file(path, mimetype=mimetype, as_attachment=True,
+                     download_name=f'problems_detailed_export.{extension}')
+
+@app.route('/export_jobs', methods=['POST'])
+def submit_export_job():
+    """Start a background export; poll /export_jobs/<id> until it is done"""
+    format = request.form.get('format') or (request.get_json(silent=True) or {}).get('format', 'excel')
+    if format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Invalid format'}), 400
+    
+    job = export_jobs.submit(format)
+    return jsonify({'success': True, 'job': job}), 202
+
+@app.route('/export_jobs/<job_id>')
+def export_job_status(job_id):
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/export_jobs/<job_id>/download')
+def download_export_job(job_id):
+    job = export_jobs.get(job_id)
+    path = export_jobs.artifact(job_id)
+    if not path:
+        return jsonify({'success': False, 'job': job}), 404 if not job else 409
+    
+    extension, mimetype = EXPORT_FORMATS[job['format']]
+    return send_file(path, mimetype=mimetype, as_attachment=True,
+                     download_name=f'problems_detailed_export.{extension}')
 
 @app.route('/add_comment/<int:problem_id>', methods=['POST'])
 def add_comment(problem_id):
-    data = load_problems()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = problem_store.get(problem_id)
     
     if problem:
         new_comment = {
-            'id': len(problem.get('comments', [])) + 1,
             'text': request.form['text'],
             'created_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'user': 'אנונימי',  # Will be replaced with actual user when auth is added
             'mentions': extract_mentions(request.form['text'])
         }
         
-        if 'comments' not in problem:
-            problem['comments'] = []
-            
-        problem['comments'].append(new_comment)
-        
         # Add to history
         history_entry = {
             'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'action': 'comment_added',
-            'details': 'נוספה תגובה חדשה'
+            'details': 'נוספה תגובה חדשה',
+            'user': session.get('user_id')
         }
-        problem['history'].append(history_entry)
-        
-        save_problems(data)
+        problem_store.append(problem_id, 'comments', new_comment, history=history_entry)
         return jsonify({'success': True, 'comment': new_comment})
     
     return jsonify({'success': False}), 404
 
 @app.route('/log_time/<int:problem_id>', methods=['POST'])
 def log_time(problem_id):
-    data = load_problems()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = problem_store.get(problem_id)
     
     if problem:
         time_entry = {
-            'id': len(problem.get('time_logs', [])) + 1,
             'minutes': int(request.form['minutes']),
             'description': request.form['description'],
             'logged_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'user': 'אנונימי'
         }
         
-        if 'time_logs' not in problem:
-            problem['time_logs'] = []
-            
-        problem['time_logs'].append(time_entry)
-        
         # Update total time spent
-        problem['total_time'] = sum(log['minutes'] for log in problem['time_logs'])
+        total_time = sum(log['minutes'] for log in problem.get('time_logs', [])) + time_entry['minutes']
         
-        save_problems(data)
+        problem_store.append(problem_id, 'time_logs', time_entry, fields={'total_time': total_time})
         return jsonify({'success': True, 'time_entry': time_entry})
     
     return jsonify({'success': False}), 404
@@ -393,7 +354,7 @@ def extract_mentions(text):
 
 @app.route('/kanban')
 def kanban_view():
-    problems = load_problems()['problems']
+    problems = problem_store.problems()
     columns = {
         'open': [],
         'in_progress': [],
@@ -408,39 +369,34 @@ def kanban_view():
 
 @app.route('/gantt')
 def gantt_view():
-    problems = load_problems()['problems']
+    problems = problem_store.problems()
     return render_template('gantt.html', problems=problems)
 
 @app.route('/update_status/<int:problem_id>', methods=['POST'])
 def update_status(problem_id):
-    data = load_problems()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = problem_store.get(problem_id)
     
     if problem:
         new_status = request.form['status']
         old_status = problem['status']
-        problem['status'] = new_status
         
         history_entry = {
             'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'action': 'status_changed',
-            'details': f'סטטוס שונה מ-{old_status} ל-{new_status}'
+            'details': f'סטטוס שונה מ-{old_status} ל-{new_status}',
+            'user': session.get('user_id')
         }
-        problem['history'].append(history_entry)
-        
-        save_problems(data)
+        problem_store.update(problem_id, {'status': new_status}, history=history_entry)
         return jsonify({'success': True})
     
     return jsonify({'success': False}), 404
 
 @app.route('/add_solution/<int:problem_id>', methods=['POST'])
 def add_solution(problem_id):
-    data = load_problems()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = problem_store.get(problem_id)
     
     if problem:
         solution = {
-            'id': len(problem.get('solutions', [])) + 1,
             'description': request.form['description'],
             'steps': request.form['steps'].split('\n'),
             'created_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -448,42 +404,34 @@ def add_solution(problem_id):
             'implemented': False
         }
         
-        if 'solutions' not in problem:
-            problem['solutions'] = []
-            
-        problem['solutions'].append(solution)
-        
         history_entry = {
             'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'action': 'solution_added',
-            'details': 'נוסף פתרון חדש'
+            'details': 'נוסף פתרון חדש',
+            'user': session.get('user_id')
         }
-        problem['history'].append(history_entry)
-        
-        save_problems(data)
+        problem_store.append(problem_id, 'solutions', solution, history=history_entry)
         return jsonify({'success': True, 'solution': solution})
     
     return jsonify({'success': False}), 404
 
 @app.route('/implement_solution/<int:problem_id>/<int:solution_id>', methods=['POST'])
 def implement_solution(problem_id, solution_id):
-    data = load_problems()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = problem_store.get(problem_id)
     
     if problem and 'solutions' in problem:
         solution = next((s for s in problem['solutions'] if s['id'] == solution_id), None)
         if solution:
-            solution['implemented'] = True
-            solution['implementation_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
             history_entry = {
                 'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'action': 'solution_implemented',
-                'details': f'פתרון {solution_id} יושם'
+                'details': f'פתרון {solution_id} יושם',
+                'user': session.get('user_id')
             }
-            problem['history'].append(history_entry)
-            
-            save_problems(data)
+            problem_store.update_item(problem_id, 'solutions', solution_id, {
+                'implemented': True,
+                'implementation_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }, history=history_entry)
             return jsonify({'success': True})
     
     return jsonify({'success': False}), 404
@@ -491,79 +439,17 @@ def implement_solution(problem_id, solution_id):
 @app.route('/tags/autocomplete')
 def tags_autocomplete():
     query = request.args.get('q', '').lower()
-    problems = load_problems()['problems']
+    limit = request.args.get('limit', 10, type=int)
     
-    # Collect all unique tags
-    all_tags = set()
-    for problem in problems:
-        all_tags.update(tag.lower() for tag in problem.get('tags', []))
-    
-    # Filter tags by query
-    matching_tags = [tag for tag in all_tags if query in tag]
-    return jsonify(matching_tags)
+    # Most used tags first, prefix matches before infix matches
+    return jsonify(tag_dictionary.autocomplete(query, limit))
 
 @app.route('/reports')
 def reports():
-    problems = load_problems()['problems']
-    today = datetime.now().date()
-    
-    # Calculate various metrics
-    metrics = {
-        'total_problems': len(problems),
-        'avg_resolution_time': 0,
-        'overdue_percentage': 0,
-        'completion_rate': 0,
-        'category_distribution': {},
-        'monthly_trends': {},
-        'tag_usage': {},
-        'solution_effectiveness': {}
-    }
-    
-    closed_problems = [p for p in problems if p['status'] == 'closed']
-    if closed_problems:
-        # Average resolution time
-        resolution_times = []
-        for problem in closed_problems:
-            created = datetime.strptime(problem['created_date'], '%Y-%m-%d').date()
-            history = problem.get('history', [])
-            closed_entry = next((h for h in reversed(history) if h['action'] == 'status_changed' and 'סגור' in h['details']), None)
-            if closed_entry:
-                closed_date = datetime.strptime(closed_entry['date'].split()[0], '%Y-%m-%d').date()
-                resolution_times.append((closed_date - created).days)
-        
-        if resolution_times:
-            metrics['avg_resolution_time'] = sum(resolution_times) / len(resolution_times)
-    
-    # Overdue percentage
-    overdue = sum(1 for p in problems if datetime.strptime(p['due_date'], '%Y-%m-%d').date() < today and p['status'] != 'closed')
-    metrics['overdue_percentage'] = (overdue / len(problems)) * 100 if problems else 0
-    
-    # Completion rate
-    metrics['completion_rate'] = (len(closed_problems) / len(problems)) * 100 if problems else 0
-    
-    # Category distribution
-    for problem in problems:
-        category = problem['category']
-        metrics['category_distribution'][category] = metrics['category_distribution'].get(category, 0) + 1
-    
-    # Monthly trends
-    for problem in problems:
-        month = problem['created_date'][:7]  # YYYY-MM
-        metrics['monthly_trends'][month] = metrics['monthly_trends'].get(month, 0) + 1
-    
-    # Tag usage
-    for problem in problems:
-        for tag in problem.get('tags', []):
-            metrics['tag_usage'][tag] = metrics['tag_usage'].get(tag, 0) + 1
-    
-    # Solution effectiveness
-    for problem in problems:
-        for solution in problem.get('solutions', []):
-            if solution.get('implemented'):
-                effectiveness = solution.get('effectiveness', 0)
-                metrics['solution_effectiveness'][problem['id']] = effectiveness
-    
-    return render_template('reports.html', metrics=metrics)
+    return render_template('reports.html', metrics=report_cache.get('reports'))
+
+def compute_report_metrics():
+    return analytics.report_metrics()
 
 @app.route('/calendar')
 def calendar_view():
@@ -575,16 +461,18 @@ def calendar_view():
     month_name = calendar.month_name[month]
     
     # Get problems for this month
-    problems = load_problems()['problems']
+    problems = due_index.problems_between(
+        datetime(year, month, 1).date(),
+        datetime(year, month, calendar.monthrange(year, month)[1]).date(),
+        include_closed=True
+    )
     problem_dates = {}
     
     for problem in problems:
-        due_date = datetime.strptime(problem['due_date'], '%Y-%m-%d').date()
-        if due_date.year == year and due_date.month == month:
-            day = due_date.day
-            if day not in problem_dates:
-                problem_dates[day] = []
-            problem_dates[day].append(problem)
+        day = int(problem['due_date'][8:10])
+        if day not in problem_dates:
+            problem_dates[day] = []
+        problem_dates[day].append(problem)
     
     return render_template('calendar.html',
                          calendar=cal,
@@ -595,107 +483,64 @@ def calendar_view():
 
 @app.route('/notifications')
 def get_notifications():
-    problems = load_problems()['problems']
-    today = datetime.now().date()
-    notifications = []
-    
-    # Due date notifications
-    for problem in problems:
-        if problem['status'] != 'closed':
-            due_date = datetime.strptime(problem['due_date'], '%Y-%m-%d').date()
-            days_until_due = (due_date - today).days
-            
-            if days_until_due <= 7:
-                notifications.append({
-                    'type': 'due_date',
-                    'problem_id': problem['id'],
-                    'title': problem['title'],
-                    'message': f'יש לך {days_until_due} ימים לסיים את הבעיה',
-                    'priority': 'high' if days_until_due <= 3 else 'medium',
-                    'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                })
-    
-    # Inactive problems notifications
-    for problem in problems:
-        if problem['status'] not in ['closed', 'review']:
-            last_activity = max(
-                datetime.strptime(entry['date'].split()[0], '%Y-%m-%d').date()
-                for entry in problem.get('history', [{'date': problem['created_date'] + ' 00:00:00'}])
-            )
-            days_inactive = (today - last_activity).days
-            
-            if days_inactive >= 7:
-                notifications.append({
-                    'type': 'inactive',
-                    'problem_id': problem['id'],
-                    'title': problem['title'],
-                    'message': f'לא הייתה פעילות בבעיה זו {days_inactive} ימים',
-                    'priority': 'medium',
-                    'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                })
-    
-    # Sort notifications by priority and date
-    priority_order = {'high': 0, 'medium': 1, 'low': 2}
-    notifications.sort(key=lambda x: (priority_order[x['priority']], x['date']))
-    
-    return jsonify(notifications)
+    return jsonify(notification_feed.feed(session.get('user_id')))
+
+@app.route('/notifications/read', methods=['POST'])
+def mark_notifications_read():
+    """Mark notifications as read: ids[] given, or all of the user's current ones"""
+    ids = request.form.getlist('ids[]') or (request.get_json(silent=True) or {}).get('ids')
+    notification_feed.mark_read(session.get('user_id'), ids or None)
+    return jsonify({'success': True})
 
 @app.route('/search')
 def advanced_search():
-    query = request.args.get('q', '').lower()
+    query = request.args.get('q', '')
     category = request.args.get('category')
     status = request.args.get('status')
     tags = request.args.getlist('tags')
     date_from = request.args.get('date_from')
     date_to = request.args.get('date_to')
     
-    problems = load_problems()['problems']
-    
-    if query:
-        problems = [p for p in problems if
-                   query in p['title'].lower() or
-                   query in p['description'].lower() or
-                   any(query in comment['text'].lower() for comment in p.get('comments', [])) or
-                   any(query in solution['description'].lower() for solution in p.get('solutions', []))]
-    
-    if category:
-        problems = [p for p in problems if p['category'] == category]
-    
-    if status:
-        problems = [p for p in problems if p['status'] == status]
-    
-    if tags:
-        problems = [p for p in problems if all(tag in p.get('tags', []) for tag in tags)]
-    
     if date_from:
-        date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
-        problems = [p for p in problems if datetime.strptime(p['created_date'], '%Y-%m-%d').date() >= date_from]
-    
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date().isoformat()
     if date_to:
-        date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
-        problems = [p for p in problems if datetime.strptime(p['due_date'], '%Y-%m-%d').date() <= date_to]
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date().isoformat()
+    
+    problems = problem_store.query(
+        category=category or None,
+        status=status or None,
+        tags=tags,
+        created_from=date_from,
+        due_to=date_to
+    )
+    
+    scores = None
+    if query:
+        problems, scores = rank_by_search(problems, query)
     
-    return jsonify(problems)
+    return problems_response(problems, scores)
 
 @app.route('/activity_log')
 def activity_log():
-    problems = load_problems()['problems']
-    activities = []
-    
-    for problem in problems:
-        for entry in problem.get('history', []):
-            activities.append({
-                'problem_id': problem['id'],
-                'problem_title': problem['title'],
-                'date': entry['date'],
-                'action': entry['action'],
-                'details': entry['details']
-            })
-    
-    # Sort activities by date (newest first)
-    activities.sort(key=lambda x: x['date'], reverse=True)
-    
-    return render_template('activity_log.html', activities=activities)
+    activities, next_before = activity_stream.page(limit=ACTIVITY_PAGE_SIZE)
+    return render_template('activity_log.html', activities=activities, next_before=next_before)
+
+@app.route('/activity_log/feed')
+def activity_feed():
+    """JSON page of the activity stream, newest first
+
+    Pass the returned next_before back as before= for the next page;
+    problem_id, user and action filter the stream.
+    """
+    limit = min(request.args.get('limit', ACTIVITY_PAGE_SIZE, type=int), 500)
+    activities, next_before = activity_stream.page(
+        limit=max(limit, 1),
+        before=request.args.get('before', type=int),
+        problem_id=request.args.get('problem_id', type=int),
+        user=request.args.get('user') or None,
+        action=request.args.get('action') or None
+    )
+    return jsonify({'items': activities, 'next_before': next_before})
 
 @app.route('/templates')
 def problem_templates():
@@ -706,8 +551,7 @@ def problem_templates():
 @app.route('/save_as_template/<int:problem_id>', methods=['POST'])
 def save_as_template(problem_id):
     """Save problem as template"""
-    data = load_problems()
-    problem = next((p for p in data['problems'] if p['id'] == problem_id), None)
+    problem = problem_store.get(problem_id)
     
     if problem:
         template = {
@@ -742,25 +586,22 @@ def create_from_template(template_id):
 @app.route('/reminders')
 def reminders():
     """View and manage reminders"""
-    problems = load_problems()['problems']
     reminders_list = []
     today = datetime.now().date()
     
-    for problem in problems:
-        if problem['status'] != 'closed':
-            due_date = datetime.strptime(problem['due_date'], '%Y-%m-%d').date()
-            days_until_due = (due_date - today).days
-            
-            if days_until_due <= 7:
-                reminder = {
-                    'problem_id': problem['id'],
-                    'title': problem['title'],
-                    'due_date': problem['due_date'],
-                    'days_left': days_until_due,
-                    'category': problem['category'],
-                    'priority': 'high' if days_until_due <= 3 else 'medium'
-                }
-                reminders_list.append(reminder)
+    for problem in due_index.problems_between(end=today + timedelta(days=7)):
+        due_date = datetime.strptime(problem['due_date'], '%Y-%m-%d').date()
+        days_until_due = (due_date - today).days
+        
+        reminder = {
+            'problem_id': problem['id'],
+            'title': problem['title'],
+            'due_date': problem['due_date'],
+            'days_left': days_until_due,
+            'category': problem['category'],
+            'priority': 'high' if days_until_due <= 3 else 'medium'
+        }
+        reminders_list.append(reminder)
     
     return render_template('reminders.html', reminders=reminders_list)
 
@@ -773,8 +614,7 @@ def save_reminder_settings():
     }
     
     # Save settings to file
-    with open(os.path.join('data', 'reminder_settings.json'), 'w') as f:
-        json.dump(settings, f, indent=4)
+    atomic_write_json(os.path.join('data', 'reminder_settings.json'), settings, indent=4)
     
     return jsonify({'success': True})
 
@@ -784,10 +624,7 @@ def suggest_tags():
     text = request.args.get('text', '').lower()
     
     # Load all existing tags for reference
-    problems = load_problems()['problems']
-    existing_tags = set()
-    for problem in problems:
-        existing_tags.update(tag.lower() for tag in problem.get('tags', []))
+    existing_tags = tag_dictionary.tags()
     
     # Simple keyword-based suggestions
     keywords = {
@@ -811,81 +648,49 @@ def suggest_tags():
         if any(word in tag for word in text.split()):
             suggested_tags.add(tag)
     
+    # Add tags that often appear together with the suggested ones
+    related_tags = set()
+    for tag in suggested_tags:
+        related_tags.update(related for related, scores in
+                            tag_cooccurrence.related(tag, k=3, by='lift', min_count=2))
+    suggested_tags |= related_tags
+    
     return jsonify(list(suggested_tags))
 
 @app.route('/advanced_reports')
 def advanced_reports():
     """Generate advanced reports and analytics"""
-    problems = load_problems()['problems']
-    today = datetime.now().date()
-    
-    # Calculate advanced metrics
-    metrics = {
-        'resolution_times': [],
-        'category_success_rates': {},
-        'tag_correlations': {},
-        'monthly_workload': {},
-        'problem_complexity': {}
-    }
+    return render_template('advanced_reports.html', metrics=report_cache.get('advanced_reports'))
+
+def compute_advanced_metrics():
+    metrics = analytics.advanced_metrics()
     
-    for problem in problems:
-        # Resolution time analysis
-        if problem['status'] == 'closed':
-            created = datetime.strptime(problem['created_date'], '%Y-%m-%d').date()
-            history = problem.get('history', [])
-            closed_entry = next((h for h in reversed(history) if h['action'] == 'status_changed' and 'סגור' in h['details']), None)
-            if closed_entry:
-                closed_date = datetime.strptime(closed_entry['date'].split()[0], '%Y-%m-%d').date()
-                resolution_time = (closed_date - created).days
-                metrics['resolution_times'].append({
-                    'problem': problem['title'],
-                    'days': resolution_time,
-                    'category': problem['category']
-                })
-        
-        # Category success rate
-        category = problem['category']
-        if category not in metrics['category_success_rates']:
-            metrics['category_success_rates'][category] = {'total': 0, 'solved': 0}
-        metrics['category_success_rates'][category]['total'] += 1
-        if problem['status'] == 'closed':
-            metrics['category_success_rates'][category]['solved'] += 1
-        
-        # Tag correlation analysis
-        tags = problem.get('tags', [])
-        for tag1 in tags:
-            for tag2 in tags:
-                if tag1 < tag2:
-                    key = f"{tag1}-{tag2}"
-                    metrics['tag_correlations'][key] = metrics['tag_correlations'].get(key, 0) + 1
-        
-        # Monthly workload
-        month = problem['created_date'][:7]
-        metrics['monthly_workload'][month] = metrics['monthly_workload'].get(month, 0) + 1
-        
-        # Problem complexity score
-        complexity_score = 0
-        complexity_score += len(problem.get('subtasks', [])) * 2
-        complexity_score += len(problem.get('comments', []))
-        complexity_score += len(problem.get('time_logs', [])) * 0.5
-        metrics['problem_complexity'][problem['title']] = complexity_score
+    # Tag correlation analysis
+    for tag1, tag2, count in tag_cooccurrence.pairs():
+        metrics['tag_correlations'][f"{tag1}-{tag2}"] = count
     
-    return render_template('advanced_reports.html', metrics=metrics)
+    return metrics
+
+report_cache.register('reports', compute_report_metrics)
+report_cache.register('advanced_reports', compute_advanced_metrics)
 
 def load_templates():
     """Load templates from JSON file"""
+    if STORAGE_BACKEND == 'sqlite':
+        return problem_store.load_templates()
     templates_file = os.path.join('data', 'templates.json')
     if not os.path.exists(templates_file):
-        with open(templates_file, 'w') as f:
-            json.dump({"templates": []}, f)
+        atomic_write_json(templates_file, {"templates": []})
     
     with open(templates_file, 'r') as f:
         return json.load(f)
 
 def save_templates(templates):
     """Save templates to JSON file"""
-    with open(os.path.join('data', 'templates.json'), 'w') as f:
-        json.dump(templates, f, indent=4)
+    if STORAGE_BACKEND == 'sqlite':
+        problem_store.save_templates(templates)
+        return
+    atomic_write_json(os.path.join('data', 'templates.json'), templates, indent=4)
 
 def generate_template_id():
     """Generate a new template ID"""
@@ -970,36 +775,10 @@ def share_problem(problem_id):
     
     permissions[str(problem_id)].append(permission)
     Permission.save_permissions(permissions)
+    permission_index.invalidate()
     
     return jsonify({'success': True})
 
-def has_permission(user_id, resource_id, required_permission):
-    """Check if user has required permission"""
-    if session.get('is_admin'):
-        return True
-        
-    permissions = Permission.load_permissions()
-    resource_permissions = permissions.get(str(resource_id), [])
-    
-    user_permission = next(
-        (p for p in resource_permissions if p['user_id'] == user_id),
-        None
-    )
-    
-    if not user_permission:
-        return False
-    
-    permission_levels = {
-        'read': 1,
-        'write': 2,
-        'admin': 3
-    }
-    
-    required_level = permission_levels[required_permission]
-    actual_level = permission_levels[user_permission['permission_type']]
-    
-    return actual_level >= required_level
-
 @app.route('/groups')
 @login_required
 def groups():
@@ -1028,6 +807,7 @@ def create_group():
     groups = Group.load_groups()
     groups['groups'].append(group)
     Group.save_groups(groups)
+    permission_index.invalidate()
     
     return jsonify({'success': True, 'group': group})
 
@@ -1051,6 +831,7 @@ def invite_to_group(group_id):
         if email not in group['members']:
             group['members'].append(email)
             Group.save_groups(groups)
+            permission_index.invalidate()
             return jsonify({'success': True})
     
     return jsonify({'success': False}), 404
@@ -1066,6 +847,7 @@ def add_member_to_group(group_id):
     if group and username not in group['members']:
         group['members'].append(username)
         Group.save_groups(groups)
+        permission_index.invalidate()
         return jsonify({'success': True})
     
     return jsonify({'success': False}), 404
@@ -1080,6 +862,7 @@ def delete_group(group_id):
     if group and group['creator_id'] == session['user_id']:
         groups['groups'] = [g for g in groups['groups'] if g['id'] != group_id]
         Group.save_groups(groups)
+        permission_index.invalidate()
         return jsonify({'success': True})
     
     return jsonify({'success': False}), 403
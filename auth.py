@@ -1,11 +1,17 @@
+from collections import OrderedDict
 from functools import wraps
-from flask import session, redirect, url_for, flash
+from flask import session, redirect, url_for, flash, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
+import hashlib
 import os
+import threading
+import time
 
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key')
+# Verified API tokens remembered at most (least recently used are dropped)
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 4096))
 
 def login_required(f):
     @wraps(f)
@@ -24,19 +30,105 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def generate_token(user_id):
+def generate_token(user_id, is_admin=False):
     return jwt.encode(
         {
             'user_id': user_id,
+            'is_admin': is_admin,
             'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
         },
         SECRET_KEY,
         algorithm='HS256'
     )
 
-def verify_token(token):
+class TokenCache:
+    """Bounded LRU cache of verified tokens, keyed by the token's SHA-256
+
+    Entries expire at the token's own exp, so a cached token is never
+    accepted for longer than decoding it would have been.
+    """
+
+    def __init__(self, size=TOKEN_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).digest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, token, data):
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (data.get('exp', 0), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+token_cache = TokenCache()
+
+def decode_token(token):
+    """Return the verified token payload or None, using the token cache"""
+    data = token_cache.get(token)
+    if data is not None:
+        return data
     try:
         data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return data['user_id']
-    except:
-        return None 
\ No newline at end of file
+    except jwt.PyJWTError:
+        return None
+    if 'user_id' not in data:
+        return None
+    token_cache.put(token, data)
+    return data
+
+def verify_token(token):
+    data = decode_token(token)
+    return data['user_id'] if data else None
+
+def bearer_token():
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+def token_required(f):
+    """Authenticate API calls by an Authorization: Bearer token
+
+    Falls back to the login session so the web pages can call the API
+    too. Sets request.user_id and request.is_admin for the view.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = bearer_token()
+        if token:
+            data = decode_token(token)
+            if data is None:
+                return jsonify({'error': 'Invalid or expired token'}), 401
+            request.user_id = data['user_id']
+            request.is_admin = bool(data.get('is_admin'))
+        elif 'user_id' in session:
+            request.user_id = session['user_id']
+            request.is_admin = bool(session.get('is_admin'))
+        else:
+            return jsonify({'error': 'Authentication required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function 
\ No newline at end of file
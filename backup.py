@@ -1,44 +1,413 @@
-import shutil
+"""Incremental, content-addressed backups of the data directory
+
+Files are split into chunks at line boundaries chosen by their content,
+so an edit or an append only changes the chunks around it. Chunks are
+stored once, compressed, under backups/chunks/ by the SHA-256 of their
+content; every snapshot is a manifest in backups/snapshots/ listing the
+chunks of each file. Files unchanged since the previous snapshot (same
+size, mtime and inode) reuse its chunk list without being read.
+
+A snapshot is only recorded once its new files were read back, checksummed
+and parsed. The store's files are captured at a single journal position,
+the other JSON files are replaced atomically when written and of appended
+logs only complete lines are taken, so no lock is taken.
+
+Snapshots are thinned out by retention tiers (the newest snapshot of each
+of the last BACKUP_KEEP_HOURLY hours, BACKUP_KEEP_DAILY days and
+BACKUP_KEEP_WEEKLY weeks) and chunks no snapshot refers to any more are
+deleted. Backups and garbage collection hold backups/backup.lock, so a
+collection never runs while another backup's chunks lack a manifest.
+"""
+import hashlib
+import json
 import os
-from datetime import datetime
-import schedule
+import sqlite3
+import sys
+import tempfile
 import threading
-import time
-
-def create_backup():
-    """Create a backup of all data files"""
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_dir = f'backups/backup_{timestamp}'
-    
-    if not os.path.exists('backups'):
-        os.makedirs('backups')
-    
-    os.makedirs(backup_dir)
-    
-    # Backup all JSON files
-    for filename in os.listdir('data'):
-        if filename.endswith('.json'):
-            shutil.copy2(
-                os.path.join('data', filename),
-                os.path.join(backup_dir, filename)
-            )
-    
-    # Clean old backups (keep last 10)
-    backups = sorted(os.listdir('backups'))
-    if len(backups) > 10:
-        for old_backup in backups[:-10]:
-            shutil.rmtree(os.path.join('backups', old_backup))
-
-def start_backup_scheduler():
-    """Start the backup scheduler in a separate thread"""
-    def run_schedule():
-        while True:
-            schedule.run_pending()
-            time.sleep(60)
-    
-    # Create backup every day at midnight
-    schedule.every().day.at("00:00").do(create_backup)
-    
-    # Run the scheduler in a separate thread
-    scheduler_thread = threading.Thread(target=run_schedule, daemon=True)
-    scheduler_thread.start() 
\ No newline at end of file
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: one backup process at a time
+    fcntl = None
+
+from store import JOURNAL_FILE, PROBLEMS_FILE, complete_length, problem_store
+
+DATA_DIR = 'data'
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+# Files of the data directory that are backed up
+BACKUP_EXTENSIONS = ('.json', '.ndjson')
+
+RETENTION = {
+    'hourly': int(os.environ.get('BACKUP_KEEP_HOURLY', 24)),
+    'daily': int(os.environ.get('BACKUP_KEEP_DAILY', 7)),
+    'weekly': int(os.environ.get('BACKUP_KEEP_WEEKLY', 4))
+}
+
+# Chunks end after a line whose CRC has these bits clear (about 1 in 16384
+# lines), but are never smaller than MIN_CHUNK or larger than MAX_CHUNK
+CHUNK_MASK = (1 << 14) - 1
+MIN_CHUNK = 256 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+COMPRESSION_LEVEL = 6
+
+_lock_state = threading.local()
+
+def chunks_dir(backup_dir=BACKUP_DIR):
+    return os.path.join(backup_dir, 'chunks')
+
+def snapshots_dir(backup_dir=BACKUP_DIR):
+    return os.path.join(backup_dir, 'snapshots')
+
+def chunk_path(digest, backup_dir=BACKUP_DIR):
+    return os.path.join(chunks_dir(backup_dir), digest[:2], digest)
+
+def iter_chunks(f):
+    """Split a binary file into content-defined chunks"""
+    parts = []
+    size = 0
+    for line in f:
+        # Lines longer than MAX_CHUNK (e.g. unindented JSON) are cut as they are
+        while size + len(line) > MAX_CHUNK:
+            cut = MAX_CHUNK - size
+            parts.append(line[:cut])
+            yield b''.join(parts)
+            parts, size, line = [], 0, line[cut:]
+        parts.append(line)
+        size += len(line)
+        if size >= MIN_CHUNK and zlib.crc32(line) & CHUNK_MASK == 0:
+            yield b''.join(parts)
+            parts, size = [], 0
+    if parts:
+        yield b''.join(parts)
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def store_chunk(data, backup_dir=BACKUP_DIR):
+    """Store a chunk unless it is already there; returns (digest, bytes written)"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = chunk_path(digest, backup_dir)
+    if os.path.exists(path):
+        return digest, 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    compressed = zlib.compress(data, COMPRESSION_LEVEL)
+    _write_atomic(path, compressed)
+    return digest, len(compressed)
+
+def read_chunk(digest, backup_dir=BACKUP_DIR):
+    with open(chunk_path(digest, backup_dir), 'rb') as f:
+        data = zlib.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f'Backup chunk {digest} is corrupt')
+    return data
+
+def _file_stamp(st):
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino}
+
+def _lines(f, length):
+    """The lines of the first length bytes of a binary file"""
+    for line in f:
+        if len(line) >= length:
+            yield line[:length]
+            return
+        length -= len(line)
+        yield line
+
+def backup_file(f, length, stamp=None, previous=None, backup_dir=BACKUP_DIR):
+    """Store the first length bytes of an open file; returns its entry and the bytes written
+
+    stamp identifies the file version (size, mtime, inode); a previous
+    entry with the same stamp is reused without reading the file.
+    """
+    if stamp is not None and previous is not None and previous.get('stamp') == stamp:
+        return previous, 0
+    digest = hashlib.sha256()
+    chunks = []
+    written = 0
+    for data in iter_chunks(_lines(f, length)):
+        digest.update(data)
+        chunk, size = store_chunk(data, backup_dir)
+        chunks.append(chunk)
+        written += size
+    return {'size': length, 'stamp': stamp, 'sha256': digest.hexdigest(), 'chunks': chunks}, written
+
+def read_file(entry, backup_dir=BACKUP_DIR):
+    """Yield the content of a backed-up file chunk by chunk, checking its hash"""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in entry['chunks']:
+        data = read_chunk(chunk, backup_dir)
+        digest.update(data)
+        size += len(data)
+        yield data
+    if size != entry['size'] or digest.hexdigest() != entry['sha256']:
+        raise ValueError('Backed-up file does not match its checksum')
+
+def iter_lines(blocks):
+    """Yield the lines of a stream of byte blocks (the last may lack its newline)"""
+    pending = b''
+    for data in blocks:
+        lines = (pending + data).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Snapshot ids, oldest first"""
+    try:
+        names = os.listdir(snapshots_dir(backup_dir))
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+def load_manifest(snapshot_id, backup_dir=BACKUP_DIR):
+    with open(os.path.join(snapshots_dir(backup_dir), f'{snapshot_id}.json'), 'r') as f:
+        return json.load(f)
+
+def _data_files(data_dir, exclude):
+    """Open the other data files at a consistent length
+
+    JSON files are replaced by atomic_write_json, so each open file is one
+    version. NDJSON logs (activity, dead letters) are appended to: only
+    their complete lines are taken.
+    """
+    files = {}
+    for filename in sorted(os.listdir(data_dir)):
+        if filename.endswith(BACKUP_EXTENSIONS) and filename not in exclude:
+            try:
+                f = open(os.path.join(data_dir, filename), 'rb')
+            except FileNotFoundError:
+                continue
+            length = os.fstat(f.fileno()).st_size
+            if filename.endswith('.ndjson'):
+                length = complete_length(f, length)
+                f.seek(0)
+            files[filename] = (f, length)
+    return files
+
+@contextmanager
+def backup_lock(backup_dir=BACKUP_DIR):
+    """Serialize backups and chunk garbage collection across processes
+
+    Garbage collection would otherwise delete the chunks of a backup whose
+    manifest is not written yet. Re-entrant within a thread.
+    """
+    if fcntl is None or getattr(_lock_state, 'held', False):
+        yield
+        return
+    os.makedirs(backup_dir, exist_ok=True)
+    with open(os.path.join(backup_dir, 'backup.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _lock_state.held = True
+        try:
+            yield
+        finally:
+            _lock_state.held = False
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def create_backup(data_dir=DATA_DIR, backup_dir=BACKUP_DIR, retention=RETENTION, store=problem_store):
+    """Take a verified, incremental snapshot of the data files, then apply retention
+
+    The store's files are captured at one journal position (or, with
+    SQLite, through the online backup API) without blocking writers.
+    """
+    with backup_lock(backup_dir):
+        os.makedirs(snapshots_dir(backup_dir), exist_ok=True)
+        snapshots = list_snapshots(backup_dir)
+        previous = load_manifest(snapshots[-1], backup_dir)['files'] if snapshots else {}
+
+        now = datetime.now()
+        manifest = {
+            'id': now.strftime('%Y%m%d_%H%M%S'),
+            'created': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'files': {},
+            'stats': {'files': 0, 'bytes': 0, 'unchanged_files': 0, 'bytes_written': 0}
+        }
+        stats = manifest['stats']
+        with store.snapshot_files() as store_files:
+            files = {**store_files, **_data_files(data_dir, store_files)}
+            try:
+                for filename, (f, length) in files.items():
+                    stamp = _file_stamp(os.fstat(f.fileno()))
+                    if length != stamp['size']:
+                        # Only part of the file belongs to the snapshot
+                        stamp = None
+                    entry, written = backup_file(f, length, stamp, previous.get(filename), backup_dir)
+                    manifest['files'][filename] = entry
+                    stats['files'] += 1
+                    stats['bytes'] += entry['size']
+                    stats['unchanged_files'] += entry is previous.get(filename)
+                    stats['bytes_written'] += written
+            finally:
+                for filename, (f, length) in files.items():
+                    if filename not in store_files:
+                        f.close()
+
+        changed = [name for name, entry in manifest['files'].items() if entry is not previous.get(name)]
+        errors = verify_files(manifest['files'], backup_dir, changed)
+        if errors:
+            raise ValueError(f'Backup {manifest["id"]} failed verification: ' + '; '.join(errors))
+        manifest['verified'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        manifest['journal_seq'] = journal_position(manifest['files'])
+
+        path = os.path.join(snapshots_dir(backup_dir), f'{manifest["id"]}.json')
+        _write_atomic(path, json.dumps(manifest, indent=4).encode())
+
+        prune_backups(backup_dir, retention)
+        return manifest
+
+# Verification
+
+def _check_json(entry, backup_dir):
+    data = json.loads(b''.join(read_file(entry, backup_dir)))
+    if isinstance(data, dict) and 'journal_seq' in data:
+        entry['journal_seq'] = data['journal_seq']
+
+def _check_ndjson(entry, backup_dir):
+    seqs = []
+    for line in iter_lines(read_file(entry, backup_dir)):
+        if not line.endswith(b'\n'):
+            raise ValueError('incomplete last line')
+        record = json.loads(line)
+        if isinstance(record, dict) and 'seq' in record:
+            seqs.append(record['seq'])
+    if seqs:
+        if any(b <= a for a, b in zip(seqs, seqs[1:])):
+            raise ValueError('journal sequence numbers out of order')
+        entry['first_seq'], entry['last_seq'] = seqs[0], seqs[-1]
+
+def _check_sqlite(entry, backup_dir):
+    fd, tmp_path = tempfile.mkstemp(suffix='.db')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for data in read_file(entry, backup_dir):
+                f.write(data)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            conn.close()
+        if result != 'ok':
+            raise ValueError(result)
+    finally:
+        os.remove(tmp_path)
+
+CHECKS = {
+    '.json': _check_json,
+    '.ndjson': _check_ndjson,
+    '.db': _check_sqlite
+}
+
+def journal_position(files):
+    """The journal seq the snapshot's problems correspond to (None without journal data)"""
+    snapshot = files.get(os.path.basename(PROBLEMS_FILE), {})
+    journal = files.get(os.path.basename(JOURNAL_FILE), {})
+    return journal.get('last_seq', snapshot.get('journal_seq'))
+
+def verify_files(files, backup_dir=BACKUP_DIR, names=None):
+    """Checksum and parse-check backed-up files; returns a list of errors
+
+    Fills in the journal positions of the problem files and checks that
+    the journal continues where the snapshot file ends.
+    """
+    errors = []
+    for name in files if names is None else names:
+        check = CHECKS.get(os.path.splitext(name)[1])
+        try:
+            if check is None:
+                for _ in read_file(files[name], backup_dir):
+                    pass
+            else:
+                check(files[name], backup_dir)
+        except (OSError, ValueError, zlib.error, sqlite3.Error) as e:
+            errors.append(f'{name}: {e}')
+
+    snapshot = files.get(os.path.basename(PROBLEMS_FILE), {})
+    journal = files.get(os.path.basename(JOURNAL_FILE), {})
+    if 'first_seq' in journal and journal['first_seq'] > snapshot.get('journal_seq', 0) + 1:
+        errors.append(f'{os.path.basename(JOURNAL_FILE)}: records missing between '
+                      f'{snapshot.get("journal_seq", 0)} and {journal["first_seq"]}')
+    return errors
+
+def verify_snapshot(snapshot_id, backup_dir=BACKUP_DIR):
+    """Re-read and check every file of a snapshot; returns a list of errors"""
+    return verify_files(load_manifest(snapshot_id, backup_dir)['files'], backup_dir)
+
+def _periods(created):
+    """The hour, day and ISO week a snapshot belongs to"""
+    year, week, _ = created.isocalendar()
+    return {
+        'hourly': created.strftime('%Y-%m-%d %H'),
+        'daily': created.strftime('%Y-%m-%d'),
+        'weekly': f'{year}-W{week:02d}'
+    }
+
+def retained_snapshots(snapshot_ids, retention=RETENTION):
+    """The snapshots kept by the retention tiers (always including the newest)"""
+    keep = set(snapshot_ids[-1:])
+    for tier, count in retention.items():
+        periods = set()
+        for snapshot_id in reversed(snapshot_ids):
+            period = _periods(datetime.strptime(snapshot_id, '%Y%m%d_%H%M%S'))[tier]
+            if period in periods:
+                continue
+            if len(periods) == count:
+                break
+            periods.add(period)
+            keep.add(snapshot_id)
+    return keep
+
+def prune_backups(backup_dir=BACKUP_DIR, retention=RETENTION):
+    """Delete snapshots outside the retention tiers and their unused chunks"""
+    with backup_lock(backup_dir):
+        snapshots = list_snapshots(backup_dir)
+        keep = retained_snapshots(snapshots, retention)
+        for snapshot_id in snapshots:
+            if snapshot_id not in keep:
+                os.remove(os.path.join(snapshots_dir(backup_dir), f'{snapshot_id}.json'))
+        return collect_garbage(backup_dir)
+
+def collect_garbage(backup_dir=BACKUP_DIR):
+    """Delete chunks that no snapshot refers to; returns how many were deleted"""
+    with backup_lock(backup_dir):
+        used = set()
+        for snapshot_id in list_snapshots(backup_dir):
+            for entry in load_manifest(snapshot_id, backup_dir)['files'].values():
+                used.update(entry['chunks'])
+        removed = 0
+        for root, _, names in os.walk(chunks_dir(backup_dir)):
+            for name in names:
+                # Temporary files of a backup still being written are left alone
+                if name not in used and not name.endswith('.tmp'):
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        return removed
+
+def main(argv=None):
+    """python backup.py [create | verify [snapshot_id...]]"""
+    args = sys.argv[1:] if argv is None else argv
+    if not args or args[0] == 'create':
+        manifest = create_backup()
+        print(f'Snapshot {manifest["id"]}: {manifest["stats"]}')
+        return 0
+    if args[0] == 'verify':
+        failed = 0
+        for snapshot_id in args[1:] or list_snapshots():
+            errors = verify_snapshot(snapshot_id)
+            print(f'{snapshot_id}: {"ok" if not errors else "; ".join(errors)}')
+            failed += bool(errors)
+        return 1 if failed else 0
+    print(main.__doc__)
+    return 2
+
+if __name__ == '__main__':
+    sys.exit(main())
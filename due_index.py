@@ -0,0 +1,110 @@
+import bisect
+import threading
+from datetime import date
+
+def due_ordinal(problem):
+    """The problem's due date as a date ordinal, None if it has none"""
+    try:
+        return date.fromisoformat(problem['due_date']).toordinal()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class DueDateIndex:
+    """Problems sorted by due date, kept current by store updates
+
+    Due dates are parsed once into ordinals and kept in sorted lists of
+    (ordinal, problem_id), one for all problems and one for problems that
+    are not closed, so a date window is a range lookup.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._clear()
+        store.add_listener(self)
+
+    def _clear(self):
+        self._all = []
+        self._open = []
+        self._entries = {}
+        self._today = None
+        self._overdue = 0
+
+    def _add(self, problem):
+        ordinal = due_ordinal(problem)
+        if ordinal is None:
+            return
+        is_open = problem.get('status') != 'closed'
+        key = (ordinal, problem['id'])
+        self._entries[problem['id']] = (ordinal, is_open)
+        bisect.insort(self._all, key)
+        if is_open:
+            bisect.insort(self._open, key)
+            if self._today is not None and ordinal < self._today:
+                self._overdue += 1
+
+    def _remove(self, problem_id):
+        entry = self._entries.pop(problem_id, None)
+        if entry is None:
+            return
+        ordinal, is_open = entry
+        key = (ordinal, problem_id)
+        for keys in (self._all, self._open) if is_open else (self._all,):
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+        if is_open and self._today is not None and ordinal < self._today:
+            self._overdue -= 1
+
+    def reset(self, problems):
+        with self._lock:
+            self._clear()
+            for problem in problems:
+                ordinal = due_ordinal(problem)
+                if ordinal is None:
+                    continue
+                is_open = problem.get('status') != 'closed'
+                self._entries[problem['id']] = (ordinal, is_open)
+                self._all.append((ordinal, problem['id']))
+                if is_open:
+                    self._open.append((ordinal, problem['id']))
+            self._all.sort()
+            self._open.sort()
+
+    def update(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._remove(old['id'])
+            if new is not None:
+                self._remove(new['id'])
+                self._add(new)
+
+    def between(self, start=None, end=None, include_closed=False):
+        """Ids of problems due from start to end (inclusive dates), by due date
+
+        Either bound may be None for an open-ended range.
+        """
+        self.store.refresh()
+        with self._lock:
+            keys = self._all if include_closed else self._open
+            lo = 0 if start is None else bisect.bisect_left(keys, (start.toordinal(),))
+            hi = len(keys) if end is None else bisect.bisect_left(keys, (end.toordinal() + 1,))
+            return [problem_id for ordinal, problem_id in keys[lo:hi]]
+
+    def problems_between(self, start=None, end=None, include_closed=False):
+        problems = (self.store.get(problem_id) for problem_id in self.between(start, end, include_closed))
+        return [problem for problem in problems if problem is not None]
+
+    def overdue(self):
+        """Number of open problems due before today
+
+        Cached for the current day and adjusted by updates, so it is only
+        re-derived (with one bisect) when the date rolls over.
+        """
+        self.store.refresh()
+        with self._lock:
+            today = date.today().toordinal()
+            if today != self._today:
+                self._today = today
+                self._overdue = bisect.bisect_left(self._open, (today,))
+            return self._overdue
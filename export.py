@@ -0,0 +1,218 @@
+"""Streaming export of all problems
+
+Rows are produced one problem at a time from store.iter_problems(), so
+memory use does not grow with the dataset. CSV and NDJSON can be
+generated straight into the response; Excel and Parquet need their footer
+before they can be read, so they are only written to files (by export
+jobs, see export_jobs.py).
+"""
+import csv
+import io
+import json
+from collections import Counter
+
+import xlsxwriter
+
+CHUNK_SIZE = 1 << 16
+# Problems per Parquet row group
+ROW_GROUP_SIZE = 10000
+
+# format -> (file extension, mimetype)
+EXPORT_FORMATS = {
+    'excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv'),
+    'ndjson': ('ndjson', 'application/x-ndjson'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# List fields exported as their own sheets in Excel
+DETAIL_SHEETS = {'solutions': 'Solutions', 'time_logs': 'Time Logs'}
+
+class ExportError(Exception):
+    pass
+
+def _kind(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'str'
+    return 'json'
+
+def _cell(value):
+    """A value as a flat cell; lists and dicts become JSON text"""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+def _detail_rows(problem, field):
+    for item in problem.get(field, []):
+        yield {'problem_id': problem['id'], 'problem_title': problem['title'], **item}
+
+class Columns:
+    """Column names (in order of first appearance) and value kinds"""
+
+    def __init__(self):
+        self.kinds = {}
+
+    def add(self, row):
+        for name, value in row.items():
+            kinds = self.kinds.setdefault(name, set())
+            kind = _kind(value)
+            if kind:
+                kinds.add(kind)
+
+    @property
+    def names(self):
+        return list(self.kinds)
+
+    def row(self, row):
+        return [_cell(row.get(name)) for name in self.kinds]
+
+def scan_columns(store, detail_fields=()):
+    """First pass: the columns of the problems and of the given list fields"""
+    columns = Columns()
+    details = {field: Columns() for field in detail_fields}
+    for problem in store.iter_problems():
+        columns.add(problem)
+        for field, detail in details.items():
+            for row in _detail_rows(problem, field):
+                detail.add(row)
+    return columns, details
+
+def iter_ndjson(store):
+    buf = []
+    size = 0
+    for problem in store.iter_problems():
+        line = json.dumps(problem, ensure_ascii=False) + '\n'
+        buf.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buf).encode('utf-8')
+            buf, size = [], 0
+    if buf:
+        yield ''.join(buf).encode('utf-8')
+
+def iter_csv(store):
+    columns, _ = scan_columns(store)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # BOM so Excel opens the Hebrew text as UTF-8
+    buf.write('\ufeff')
+    writer.writerow(columns.names)
+    for problem in store.iter_problems():
+        writer.writerow(columns.row(problem))
+        if buf.tell() >= CHUNK_SIZE:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode('utf-8')
+
+def write_excel(store, path):
+    columns, details = scan_columns(store, DETAIL_SHEETS)
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_urls': False})
+    try:
+        sheets = {}
+        problems_sheet = workbook.add_worksheet('Problems')
+        problems_sheet.write_row(0, 0, columns.names)
+        sheets[None] = [problems_sheet, 1]
+        for field, name in DETAIL_SHEETS.items():
+            if details[field].names:
+                sheet = workbook.add_worksheet(name)
+                sheet.write_row(0, 0, details[field].names)
+                sheets[field] = [sheet, 1]
+
+        # Sheets are filled side by side; constant_memory only requires
+        # rows to be written in order within each sheet
+        status_counts = Counter()
+        for problem in store.iter_problems():
+            status_counts[problem.get('status')] += 1
+            entry = sheets[None]
+            entry[0].write_row(entry[1], 0, columns.row(problem))
+            entry[1] += 1
+            for field in DETAIL_SHEETS:
+                entry = sheets.get(field)
+                if entry is None:
+                    continue
+                for row in _detail_rows(problem, field):
+                    entry[0].write_row(entry[1], 0, details[field].row(row))
+                    entry[1] += 1
+
+        # Status distribution pie chart
+        summary = workbook.add_worksheet('Summary')
+        summary.write_row(0, 0, ['status', 'count'])
+        for i, (status, count) in enumerate(status_counts.most_common(), start=1):
+            summary.write_row(i, 0, [status, count])
+        if status_counts:
+            chart = workbook.add_chart({'type': 'pie'})
+            chart.add_series({
+                'categories': ['Summary', 1, 0, len(status_counts), 0],
+                'values': ['Summary', 1, 1, len(status_counts), 1],
+                'name': 'Status Distribution'
+            })
+            summary.insert_chart('D2', chart)
+    finally:
+        workbook.close()
+
+def _parquet_type(pa, kinds):
+    if kinds and kinds <= {'int'}:
+        return pa.int64()
+    if kinds and kinds <= {'int', 'float'}:
+        return pa.float64()
+    if kinds == {'bool'}:
+        return pa.bool_()
+    return pa.string()
+
+def write_parquet(store, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError('Parquet export requires pyarrow')
+
+    columns, _ = scan_columns(store)
+    schema = pa.schema([(name, _parquet_type(pa, kinds)) for name, kinds in columns.kinds.items()])
+    strings = {field.name for field in schema if field.type == pa.string()}
+
+    def column(batch, name):
+        values = [problem.get(name) for problem in batch]
+        if name in strings:
+            values = [None if v is None else v if isinstance(v, str) else json.dumps(v, ensure_ascii=False)
+                      for v in values]
+        return values
+
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for problem in store.iter_problems():
+            batch.append(problem)
+            if len(batch) >= ROW_GROUP_SIZE:
+                writer.write_table(pa.table({name: column(batch, name) for name in columns.names}, schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.table({name: column(batch, name) for name in columns.names}, schema=schema))
+
+FILE_WRITERS = {'excel': write_excel, 'parquet': write_parquet}
+STREAM_WRITERS = {'csv': iter_csv, 'ndjson': iter_ndjson}
+
+def write_export(store, format, path):
+    """Write a complete export of the given format to path"""
+    if format in FILE_WRITERS:
+        FILE_WRITERS[format](store, path)
+        return
+    with open(path, 'wb') as f:
+        for chunk in STREAM_WRITERS[format](store):
+            f.write(chunk)
+
+def export_stream(store, format):
+    """Return (chunks, mimetype, filename) for streaming an export
+
+    Only for the STREAM_WRITERS formats; raises KeyError for the others.
+    """
+    chunks = STREAM_WRITERS[format](store)
+    extension, mimetype = EXPORT_FORMATS[format]
+    return chunks, mimetype, f'problems_detailed_export.{extension}'
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from export import EXPORT_FORMATS, ExportError, write_export
+
+EXPORT_DIR = 'data/exports'
+# Finished jobs are forgotten after this many seconds (their artifact stays cached)
+JOB_TTL = 3600
+
+class ExportJobs:
+    """Exports generated by a worker pool and cached per dataset version
+
+    Artifacts are named after the format and the store version they were
+    generated from, so an export of unchanged data is served from disk,
+    also after a restart. Only the newest artifact of each format is kept.
+    """
+
+    def __init__(self, store, backend, directory=EXPORT_DIR, workers=2):
+        self.store = store
+        self.backend = backend
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._by_artifact = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _version(self):
+        self.store.refresh()
+        return self.store.version
+
+    def artifact_path(self, format, version):
+        extension = EXPORT_FORMATS[format][0]
+        return os.path.join(self.directory, f'problems-{self.backend}-v{version}.{extension}')
+
+    def cached(self, format):
+        """Path of an up to date artifact for format, or None"""
+        path = self.artifact_path(format, self._version())
+        return path if os.path.exists(path) else None
+
+    def _public(self, job):
+        return {key: value for key, value in job.items() if key != 'path'}
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL
+        for job_id, job in list(self._jobs.items()):
+            if job['status'] in ('done', 'failed') and job['finished_at'] < cutoff:
+                del self._jobs[job_id]
+                if self._by_artifact.get(job['path']) == job_id:
+                    del self._by_artifact[job['path']]
+
+    def submit(self, format):
+        """Start an export (or join an identical one) and return the job
+
+        Raises KeyError for unknown formats.
+        """
+        version = self._version()
+        path = self.artifact_path(format, version)
+        with self._lock:
+            self._prune()
+            job_id = self._by_artifact.get(path)
+            if job_id is not None and self._jobs[job_id]['status'] != 'failed':
+                return self._public(self._jobs[job_id])
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'format': format,
+                'version': version,
+                'status': 'queued',
+                'created_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'finished_at': None,
+                'error': None,
+                'path': path
+            }
+            if os.path.exists(path):
+                job['status'] = 'done'
+                job['finished_at'] = time.time()
+            else:
+                self._executor.submit(self._run, job)
+            self._jobs[job['id']] = job
+            self._by_artifact[path] = job['id']
+            return self._public(job)
+
+    def _relabel(self, job, version):
+        """File a job that has not started yet under the current version"""
+        path = self.artifact_path(job['format'], version)
+        with self._lock:
+            if self._by_artifact.get(job['path']) == job['id']:
+                del self._by_artifact[job['path']]
+            self._by_artifact.setdefault(path, job['id'])
+            job['version'] = version
+            job['path'] = path
+
+    def _run(self, job):
+        job['status'] = 'running'
+        version = self._version()
+        if version != job['version']:
+            self._relabel(job, version)
+        # Unique per worker: other processes may export the same version
+        tmp_path = f'{job["path"]}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+        try:
+            write_export(self.store, job['format'], tmp_path)
+            if self._version() != version:
+                # Read across a change: the file may mix two versions
+                raise ExportError('The data changed during the export; export again')
+            os.replace(tmp_path, job['path'])
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = 'failed'
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        else:
+            job['status'] = 'done'
+            self._remove_stale(job)
+        job['finished_at'] = time.time()
+
+    def _remove_stale(self, job):
+        """Delete artifacts of the same format made from older versions"""
+        prefix = f'problems-{self.backend}-v'
+        suffix = '.' + EXPORT_FORMATS[job['format']][0]
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(prefix) and name.endswith(suffix) and path != job['path']:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def artifact(self, job_id):
+        """Path of a finished job's file, or None while it is not ready"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job['status'] != 'done' or not os.path.exists(job['path']):
+            return None
+        return job['path']
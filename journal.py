@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+
+def archive_path(path):
+    """Where the records compacted out of the journal at path are kept"""
+    root, extension = os.path.splitext(path)
+    return f'{root}_archive{extension}'
+
+def complete_length(f, size):
+    """Length of the complete (newline-terminated) lines in the first size bytes"""
+    end = size
+    while end > 0:
+        start = max(end - (1 << 16), 0)
+        f.seek(start)
+        i = f.read(end - start).rfind(b'\n')
+        if i >= 0:
+            return start + i + 1
+        end = start
+    return 0
+
+class MutationJournal:
+    """Append-only NDJSON log of problem mutations
+
+    Every record is written and flushed to the OS immediately so other
+    processes can tail it, while fsync calls are batched by a background
+    thread (at most one per sync_interval seconds).
+
+    Records dropped from the head by compaction are moved to an archive
+    file next to the journal, so a snapshot plus the archive and the
+    journal can still be replayed to any later point (restore --at).
+    """
+
+    def __init__(self, path, sync_interval=0.05):
+        self.path = path
+        self.archive_path = archive_path(path)
+        self.sync_interval = sync_interval
+        self._file = None
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._syncer = None
+
+    def _open(self):
+        if self._file is not None:
+            # Another process may have compacted and replaced the file
+            try:
+                replaced = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+            except FileNotFoundError:
+                replaced = True
+            if replaced:
+                self._file.close()
+                self._file = None
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        return self._file
+
+    def append(self, record):
+        """Write one record, returning the journal size after the write"""
+        line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            size = f.tell()
+            self._start_syncer()
+        self._dirty.set()
+        return size
+
+    def _start_syncer(self):
+        if self._syncer is None:
+            self._syncer = threading.Thread(target=self._sync_loop, daemon=True)
+            self._syncer.start()
+
+    def _sync_loop(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(self.sync_interval)
+            self._dirty.clear()
+            self.sync()
+
+    def sync(self):
+        """fsync everything written so far"""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+
+    def read(self, offset=0):
+        """Yield (record, end_offset) for complete records after offset"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Partially written record, picked up on the next read
+                    break
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                yield record, offset
+
+    def stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def _archive(self, src, offset):
+        """Append the records before offset to the archive, skipping those already there"""
+        with open(self.archive_path, 'ab+') as archive:
+            end = archive.seek(0, os.SEEK_END)
+            length = complete_length(archive, end)
+            if length < end:
+                # A record torn by a crash during the last archiving
+                archive.truncate(length)
+            last_seq = 0
+            if length:
+                start = complete_length(archive, length - 1)
+                archive.seek(start)
+                last_seq = json.loads(archive.read(length - start))['seq']
+            src.seek(0)
+            position = 0
+            for line in src:
+                position += len(line)
+                if position > offset:
+                    break
+                # Archived by a compaction that did not get to truncate the journal
+                if last_seq and json.loads(line)['seq'] <= last_seq:
+                    continue
+                last_seq = 0
+                archive.write(line)
+            archive.flush()
+            os.fsync(archive.fileno())
+
+    def prune_archive(self, before):
+        """Drop archived records written before the timestamp before"""
+        with self._lock:
+            try:
+                src = open(self.archive_path, 'rb')
+            except FileNotFoundError:
+                return
+            with src:
+                first = src.readline()
+                if not first.endswith(b'\n') or json.loads(first).get('ts', '') >= before:
+                    return
+                tmp_path = self.archive_path + '.tmp'
+                with open(tmp_path, 'wb') as dst:
+                    keep = False
+                    for line in src:
+                        if not keep and line.endswith(b'\n') and json.loads(line).get('ts', '') < before:
+                            continue
+                        keep = True
+                        dst.write(line)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+            os.replace(tmp_path, self.archive_path)
+
+    def truncate_head(self, offset):
+        """Atomically move everything before offset to the archive, returning the new size"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            tmp_path = self.path + '.tmp'
+            with open(self.path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                self._archive(src, offset)
+                src.seek(offset)
+                while True:
+                    chunk = src.read(1 << 20)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                dst.flush()
+                os.fsync(dst.fileno())
+                size = dst.tell()
+            os.replace(tmp_path, self.path)
+            return size
@@ -0,0 +1,100 @@
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+class JSONStreamReader:
+    """Decodes a JSON document incrementally from a text file
+
+    Only the value currently being decoded is held in memory, so arrays
+    of any size can be walked element by element.
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Read at least as much as is buffered so large values decode in O(n)
+        chunk = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f'Expected {char!r} but found {found!r}')
+        self.pos += 1
+
+    def value(self):
+        """Decode and consume the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+def iter_array(reader):
+    """Yield the elements of the array at the reader's position"""
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f'Expected "," or "]" but found {separator!r}')
+
+def iter_members(f, stream_keys=()):
+    """Yield (key, value) for each member of a top-level JSON object
+
+    Arrays stored under one of stream_keys are not decoded as a whole;
+    instead (key, element) is yielded for each of their elements.
+    """
+    reader = JSONStreamReader(f)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key in stream_keys and reader.peek() == '[':
+            for element in iter_array(reader):
+                yield key, element
+        else:
+            yield key, reader.value()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == '}':
+            return
+        if separator != ',':
+            raise ValueError(f'Expected "," or "}}" but found {separator!r}')
@@ -0,0 +1,236 @@
+"""Background email delivery
+
+Messages are put on a bounded queue and return immediately. A dispatcher
+thread collects them for a short window and merges the messages for one
+recipient into a single digest, then hands the digests to a pool of
+sender threads. Each sender keeps its SMTP connection open between
+messages. Failed deliveries are retried with exponential backoff;
+messages that are refused permanently, that run out of attempts or that
+do not fit in the queue are appended to a dead-letter file.
+
+Configured through the SMTP_* and MAIL_* environment variables.
+"""
+import heapq
+import json
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+
+SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 25))
+SMTP_USER = os.environ.get('SMTP_USER')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '0') == '1'
+SMTP_TIMEOUT = 30
+MAIL_FROM = os.environ.get('MAIL_FROM', 'noreply@localhost')
+
+MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS', 4))
+MAIL_QUEUE_SIZE = int(os.environ.get('MAIL_QUEUE_SIZE', 10000))
+# Messages for one recipient arriving within this many seconds form one digest
+MAIL_DIGEST_SECONDS = float(os.environ.get('MAIL_DIGEST_SECONDS', 5))
+MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 5))
+# Delay before the first retry; doubled for every further attempt
+MAIL_RETRY_SECONDS = float(os.environ.get('MAIL_RETRY_SECONDS', 30))
+
+DEAD_LETTER_FILE = 'data/mail_dead_letter.ndjson'
+
+def smtp_connect():
+    """Open an SMTP connection from the environment settings"""
+    connection = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        connection.starttls()
+    if SMTP_USER:
+        connection.login(SMTP_USER, SMTP_PASSWORD)
+    return connection
+
+def _permanent(error):
+    """Whether retrying cannot help (5xx replies, refused recipients)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    code = getattr(error, 'smtp_code', None)
+    return code is not None and 500 <= code < 600
+
+class Digest:
+    """The messages for one recipient sent as one email"""
+
+    def __init__(self, recipient):
+        self.recipient = recipient
+        self.messages = []
+        self.attempts = 0
+
+    def email(self, sender):
+        message = EmailMessage()
+        message['From'] = sender
+        message['To'] = self.recipient
+        if len(self.messages) == 1:
+            subject, body = self.messages[0]
+        else:
+            subject = f'{len(self.messages)} תזכורות חדשות'
+            body = '\n\n'.join(f'{s}\n{b}' for s, b in self.messages)
+        message['Subject'] = subject
+        message.set_content(body)
+        return message
+
+class Mailer:
+    def __init__(self, connect=smtp_connect, sender=MAIL_FROM, workers=MAIL_WORKERS,
+                 queue_size=MAIL_QUEUE_SIZE, digest_seconds=MAIL_DIGEST_SECONDS,
+                 max_attempts=MAIL_MAX_ATTEMPTS, retry_seconds=MAIL_RETRY_SECONDS,
+                 dead_letter_file=DEAD_LETTER_FILE):
+        self.connect = connect
+        self.sender = sender
+        self.digest_seconds = digest_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.dead_letter_file = dead_letter_file
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mail')
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._retries = []
+        self._closed = False
+        self.stats = {'queued': 0, 'sent': 0, 'retried': 0, 'dead': 0}
+        self._dispatcher = threading.Thread(target=self._dispatch, name='mail-dispatch', daemon=True)
+        self._dispatcher.start()
+
+    def send(self, recipient, subject, body):
+        """Queue a message; returns False if it went to the dead-letter file"""
+        with self._lock:
+            self._in_flight += 1
+        try:
+            self._queue.put_nowait((recipient, subject, body))
+        except queue.Full:
+            digest = Digest(recipient)
+            digest.messages.append((subject, body))
+            self._dead(digest, 'queue full')
+            return False
+        with self._lock:
+            self.stats['queued'] += 1
+        return True
+
+    # Dispatcher thread: digest batching and retry timing
+
+    def _dispatch(self):
+        pending = {}
+        deadline = None
+        while not self._closed or pending or self._retries or not self._queue.empty():
+            now = time.monotonic()
+            wait = 1.0
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            with self._lock:
+                if self._retries:
+                    wait = min(wait, self._retries[0][0] - now)
+            try:
+                item = self._queue.get(timeout=max(wait, 0))
+                while True:
+                    recipient, subject, body = item
+                    if recipient not in pending:
+                        pending[recipient] = Digest(recipient)
+                    pending[recipient].messages.append((subject, body))
+                    if deadline is None:
+                        deadline = time.monotonic() + self.digest_seconds
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if deadline is not None and (now >= deadline or self._closed):
+                for digest in pending.values():
+                    self._executor.submit(self._deliver, digest)
+                pending = {}
+                deadline = None
+            with self._lock:
+                due = []
+                while self._retries and self._retries[0][0] <= now:
+                    due.append(heapq.heappop(self._retries)[2])
+            for digest in due:
+                self._executor.submit(self._deliver, digest)
+
+    # Sender threads
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connect()
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            with self._lock:
+                self._connections.remove(connection)
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _deliver(self, digest):
+        digest.attempts += 1
+        try:
+            self._connection().send_message(digest.email(self.sender))
+        except Exception as e:
+            if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                # No reply from the server: reconnect for the next message
+                self._drop_connection()
+            if _permanent(e) or digest.attempts >= self.max_attempts:
+                self._dead(digest, repr(e))
+                return
+            delay = self.retry_seconds * 2 ** (digest.attempts - 1) * random.uniform(0.8, 1.2)
+            with self._lock:
+                heapq.heappush(self._retries, (time.monotonic() + delay, id(digest), digest))
+                self.stats['retried'] += len(digest.messages)
+            return
+        self._done(digest, 'sent')
+
+    def _dead(self, digest, error):
+        line = json.dumps({
+            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'recipient': digest.recipient,
+            'messages': [{'subject': s, 'body': b} for s, b in digest.messages],
+            'attempts': digest.attempts,
+            'error': error
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(self.dead_letter_file, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        self._done(digest, 'dead')
+
+    def _done(self, digest, outcome):
+        with self._lock:
+            self.stats[outcome] += len(digest.messages)
+            self._in_flight -= len(digest.messages)
+            if not self._in_flight:
+                self._idle.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every queued message was sent or dead-lettered"""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._in_flight, timeout)
+
+    def close(self, timeout=None):
+        """Send what is queued (retries included), then close the connections"""
+        self._closed = True
+        self._dispatcher.join(timeout)
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            retries, self._retries = self._retries, []
+            connections, self._connections = self._connections, []
+        for _, _, digest in retries:
+            self._dead(digest, 'closed before retry')
+        for connection in connections:
+            try:
+                connection.quit()
+            except Exception:
+                pass
@@ -0,0 +1,207 @@
+"""Migrate the JSON data files into the SQLite storage backend
+
+Every file is stream-parsed and written in batched transactions. Progress
+is committed together with each batch, so an interrupted migration picks
+up where it stopped when run again. Problems whose id collides with an
+earlier one (left by the old len()+1 allocation) get fresh ids; the
+mapping is kept in the id_remap table.
+
+    python migrate.py [--data-dir data] [--database data/problems.db]
+"""
+import argparse
+import os
+import sys
+import time
+
+from jsonstream import iter_members
+from journal import MutationJournal
+from sqlite_store import SQLiteProblemStore
+from store import DATABASE_FILE
+
+STATE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS migration_state (
+    name TEXT PRIMARY KEY,
+    items INTEGER NOT NULL,
+    done INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS id_remap (
+    position INTEGER PRIMARY KEY,
+    old_id INTEGER NOT NULL,
+    new_id INTEGER NOT NULL
+);
+'''
+
+class Migration:
+    def __init__(self, data_dir, database, batch_size=1000, out=sys.stdout):
+        self.data_dir = data_dir
+        self.batch_size = batch_size
+        self.out = out
+        self.store = SQLiteProblemStore(database)
+        with self.store.transaction() as conn:
+            for statement in STATE_SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+
+    def _path(self, filename):
+        return os.path.join(self.data_dir, filename)
+
+    def _state(self, name):
+        with self.store.transaction() as conn:
+            row = conn.execute('SELECT items, done FROM migration_state WHERE name = ?', (name,)).fetchone()
+        return row if row else (0, 0)
+
+    def _save_state(self, conn, name, items, done=0):
+        conn.execute('INSERT OR REPLACE INTO migration_state (name, items, done) VALUES (?, ?, ?)',
+                     (name, items, done))
+
+    def _report(self, name, count, started, final=False):
+        elapsed = max(time.time() - started, 1e-9)
+        status = 'done' if final else 'migrating'
+        print(f'{name}: {status} {count} items in {elapsed:.1f}s ({count / elapsed:.0f} items/s)', file=self.out)
+
+    def _run(self, name, items, write, finish=None):
+        """Write items in batches, skipping those committed by an earlier run"""
+        skip, done = self._state(name)
+        if done:
+            print(f'{name}: already migrated ({skip} items)', file=self.out)
+            return
+        if skip:
+            print(f'{name}: resuming after {skip} items', file=self.out)
+
+        started = time.time()
+        position = 0
+        batch = []
+
+        def flush():
+            with self.store.transaction() as conn:
+                for pos, item in batch:
+                    write(conn, pos, item)
+                self._save_state(conn, name, position)
+            batch.clear()
+            self._report(name, position - skip, started)
+
+        for index, item in enumerate(items):
+            position = index + 1
+            if index < skip:
+                continue
+            batch.append((index, item))
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+        with self.store.transaction() as conn:
+            if finish:
+                finish(conn)
+            self._save_state(conn, name, max(position, skip), done=1)
+            self.store.bump_version(conn)
+        self._report(name, max(position - skip, 0), started, final=True)
+
+    def _open(self, filename):
+        path = self._path(filename)
+        if not os.path.exists(path):
+            print(f'{filename}: not found, skipping', file=self.out)
+            return None
+        return open(path, 'r')
+
+    def _scan_problems(self, f):
+        """First pass: find duplicate ids without keeping the problems themselves"""
+        seen = set()
+        duplicates = []
+        meta = {}
+        position = 0
+        for key, value in iter_members(f, stream_keys=('problems',)):
+            if key != 'problems':
+                meta[key] = value
+                continue
+            if value['id'] in seen:
+                duplicates.append(position)
+            seen.add(value['id'])
+            position += 1
+        next_id = max(seen | {meta.get('sequences', {}).get('problem', 0)}) if seen else 0
+        remap = {}
+        for position in duplicates:
+            next_id += 1
+            remap[position] = next_id
+        return remap, meta
+
+    def migrate_problems(self):
+        f = self._open('problems.json')
+        if f is None:
+            return None
+        with f:
+            remap, meta = self._scan_problems(f)
+            f.seek(0)
+            problems = (value for key, value in iter_members(f, stream_keys=('problems',))
+                        if key == 'problems')
+
+            def write(conn, position, problem):
+                if position in remap:
+                    conn.execute('INSERT OR REPLACE INTO id_remap (position, old_id, new_id) VALUES (?, ?, ?)',
+                                 (position, problem['id'], remap[position]))
+                    problem['id'] = remap[position]
+                self.store.add_problem_row(conn, problem)
+
+            def finish(conn):
+                for name, value in meta.get('sequences', {}).items():
+                    self.store.observe_sequence(conn, name, value)
+
+            self._run('problems.json', problems, write, finish)
+        if remap:
+            print(f'problems.json: {len(remap)} duplicate ids were reassigned (see id_remap)', file=self.out)
+        return meta.get('journal_seq', 0)
+
+    def migrate_journal(self, journal_seq):
+        path = self._path('problems_journal.ndjson')
+        if not os.path.exists(path):
+            return
+        records = (record for record, offset in MutationJournal(path).read()
+                   if record['seq'] > journal_seq)
+
+        def write(conn, position, record):
+            for op in record['ops']:
+                self.store.apply_op(conn, op)
+
+        self._run('problems_journal.ndjson', records, write)
+
+    def migrate_document(self, filename, write, stream_key=None):
+        f = self._open(filename)
+        if f is None:
+            return
+        with f:
+            if stream_key:
+                items = (value for key, value in iter_members(f, stream_keys=(stream_key,))
+                         if key == stream_key)
+            else:
+                items = iter_members(f)
+            self._run(filename, items, write)
+
+    def run(self):
+        started = time.time()
+        journal_seq = self.migrate_problems()
+        if journal_seq is not None:
+            self.migrate_journal(journal_seq)
+        store = self.store
+        self.migrate_document('users.json', lambda conn, pos, item: store.add_user_row(conn, *item))
+        self.migrate_document('permissions.json', lambda conn, pos, item: store.add_permission_rows(conn, *item))
+        self.migrate_document('groups.json', lambda conn, pos, group: store.add_group_row(conn, group), 'groups')
+        self.migrate_document('templates.json', lambda conn, pos, t: store.add_template_row(conn, t), 'templates')
+        print(f'Migration finished in {time.time() - started:.1f}s', file=self.out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrate JSON data files into SQLite')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--database', default=DATABASE_FILE)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--restart', action='store_true',
+                        help='delete the target database and start from scratch')
+    args = parser.parse_args(argv)
+
+    if args.restart:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+    Migration(args.data_dir, args.database, args.batch_size).run()
+
+if __name__ == '__main__':
+    main()
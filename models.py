@@ -1,6 +1,7 @@
 from datetime import datetime
 import json
 import os
+from store import STORAGE_BACKEND, atomic_write_json, problem_store
 
 class User:
     def __init__(self, username, email, password_hash, role='user'):
@@ -14,6 +15,8 @@ class User:
 
     @staticmethod
     def load_users():
+        if STORAGE_BACKEND == 'sqlite':
+            return problem_store.load_users()
         if not os.path.exists('data/users.json'):
             return {}
         with open('data/users.json', 'r') as f:
@@ -21,8 +24,10 @@ class User:
 
     @staticmethod
     def save_users(users):
-        with open('data/users.json', 'w') as f:
-            json.dump(users, f, indent=4)
+        if STORAGE_BACKEND == 'sqlite':
+            problem_store.save_users(users)
+            return
+        atomic_write_json('data/users.json', users, indent=4)
 
 class Permission:
     def __init__(self, user_id, resource_id, permission_type):
@@ -33,6 +38,8 @@ class Permission:
 
     @staticmethod
     def load_permissions():
+        if STORAGE_BACKEND == 'sqlite':
+            return problem_store.load_permissions()
         if not os.path.exists('data/permissions.json'):
             return {}
         with open('data/permissions.json', 'r') as f:
@@ -40,8 +47,10 @@ class Permission:
 
     @staticmethod
     def save_permissions(permissions):
-        with open('data/permissions.json', 'w') as f:
-            json.dump(permissions, f, indent=4) 
+        if STORAGE_BACKEND == 'sqlite':
+            problem_store.save_permissions(permissions)
+            return
+        atomic_write_json('data/permissions.json', permissions, indent=4)
 
 class Group:
     def __init__(self, name, description, creator_id):
@@ -53,6 +62,8 @@ class Group:
 
     @staticmethod
     def load_groups():
+        if STORAGE_BACKEND == 'sqlite':
+            return problem_store.load_groups()
         if not os.path.exists('data/groups.json'):
             return {'groups': []}
         with open('data/groups.json', 'r') as f:
@@ -60,11 +71,15 @@ class Group:
 
     @staticmethod
     def save_groups(groups):
-        with open('data/groups.json', 'w') as f:
-            json.dump(groups, f, indent=4)
+        if STORAGE_BACKEND == 'sqlite':
+            problem_store.save_groups(groups)
+            return
+        atomic_write_json('data/groups.json', groups, indent=4)
             
     @staticmethod
     def load_user_groups(user_id):
+        if STORAGE_BACKEND == 'sqlite':
+            return problem_store.load_user_groups(user_id)
         groups = Group.load_groups()
         return [g for g in groups['groups'] 
                 if user_id in g['members'] or g['creator_id'] == user_id] 
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""Materialized per-user notification feed
+
+The feed is rebuilt by a background job (materialize) only for problems
+that changed since the previous run, plus once a day when the date rolls
+over and day counts change. Serving a feed is a lookup of the user's
+problem ids; read/unread state is kept in data/notification_state.json.
+"""
+import json
+import os
+import threading
+from datetime import date, datetime
+
+from store import atomic_write_json
+
+READ_STATE_FILE = 'data/notification_state.json'
+
+DUE_SOON_DAYS = 7
+HIGH_PRIORITY_DAYS = 3
+INACTIVE_DAYS = 7
+# Statuses that never get inactivity notifications
+INACTIVE_EXEMPT = ('closed', 'review')
+
+# Feed of problems without an owner, shown to every user
+SHARED_FEED = ''
+
+PRIORITY_ORDER = {'high': 0, 'medium': 1, 'low': 2}
+
+def last_activity(problem):
+    """Timestamp of the problem's last change (older problems: newest history date)"""
+    if problem.get('last_activity'):
+        return problem['last_activity']
+    dates = [entry['date'] for entry in problem.get('history', []) if entry.get('date')]
+    return max(dates) if dates else problem.get('created_date', '') + ' 00:00:00'
+
+def _parse_date(text):
+    try:
+        return date.fromisoformat(text[:10])
+    except (TypeError, ValueError):
+        return None
+
+def problem_notifications(problem, today):
+    """The notifications a problem currently warrants"""
+    notifications = []
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    due_date = _parse_date(problem.get('due_date'))
+    if problem.get('status') != 'closed' and due_date is not None:
+        days_until_due = (due_date - today).days
+        if days_until_due <= DUE_SOON_DAYS:
+            notifications.append({
+                'id': f'due_date:{problem["id"]}:{problem["due_date"]}',
+                'type': 'due_date',
+                'problem_id': problem['id'],
+                'title': problem.get('title'),
+                'message': f'יש לך {days_until_due} ימים לסיים את הבעיה',
+                'priority': 'high' if days_until_due <= HIGH_PRIORITY_DAYS else 'medium',
+                'date': now
+            })
+
+    activity = last_activity(problem)
+    last_date = _parse_date(activity)
+    if problem.get('status') not in INACTIVE_EXEMPT and last_date is not None:
+        days_inactive = (today - last_date).days
+        if days_inactive >= INACTIVE_DAYS:
+            notifications.append({
+                'id': f'inactive:{problem["id"]}:{activity}',
+                'type': 'inactive',
+                'problem_id': problem['id'],
+                'title': problem.get('title'),
+                'message': f'לא הייתה פעילות בבעיה זו {days_inactive} ימים',
+                'priority': 'medium',
+                'date': now
+            })
+    return notifications
+
+class NotificationFeed:
+    """Notifications per user, materialized from the problems in the background"""
+
+    def __init__(self, store, state_file=READ_STATE_FILE):
+        self.store = store
+        self.state_file = state_file
+        self._lock = threading.RLock()
+        self._items = {}
+        self._recipient = {}
+        self._by_user = {}
+        self._dirty = set()
+        self._rebuild = True
+        self._today = None
+        self._read = {}
+        self._state_stamp = None
+        store.add_listener(self)
+
+    # Store listener: only remember what needs rebuilding
+
+    def reset(self, problems):
+        with self._lock:
+            self._rebuild = True
+
+    def update(self, old, new):
+        with self._lock:
+            self._dirty.add((new or old)['id'])
+
+    def _set(self, problem_id, owner, notifications):
+        recipient = self._recipient.pop(problem_id, None)
+        if recipient is not None:
+            self._by_user[recipient].discard(problem_id)
+        self._items.pop(problem_id, None)
+        if notifications:
+            recipient = owner or SHARED_FEED
+            self._items[problem_id] = notifications
+            self._recipient[problem_id] = recipient
+            self._by_user.setdefault(recipient, set()).add(problem_id)
+
+    def materialize(self):
+        """Bring the feed up to date; run periodically by the scheduler"""
+        self.store.refresh()
+        today = date.today()
+        with self._lock:
+            rebuild = self._rebuild or today != self._today
+            dirty, self._dirty = self._dirty, set()
+            self._rebuild = False
+
+        # The store is read without holding our lock: store updates call
+        # update() while holding the store's lock
+        if rebuild:
+            problems = [(problem['id'], problem) for problem in list(self.store.problems())]
+        else:
+            problems = [(problem_id, self.store.get(problem_id)) for problem_id in dirty]
+        results = [(problem_id, problem.get('owner_id'), problem_notifications(problem, today))
+                   for problem_id, problem in problems if problem is not None]
+        results += [(problem_id, None, []) for problem_id, problem in problems if problem is None]
+
+        with self._lock:
+            if rebuild:
+                self._items, self._recipient, self._by_user = {}, {}, {}
+            for problem_id, owner, notifications in results:
+                self._set(problem_id, owner, notifications)
+            self._today = today
+
+    # Read state
+
+    def _state_mtime(self):
+        try:
+            return os.stat(self.state_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_state(self):
+        stamp = self._state_mtime()
+        if stamp != self._state_stamp:
+            self._read = {}
+            if stamp is not None:
+                with open(self.state_file, 'r') as f:
+                    self._read = json.load(f)
+            self._state_stamp = stamp
+
+    def _save_state(self):
+        atomic_write_json(self.state_file, self._read, indent=4, ensure_ascii=False)
+        self._state_stamp = self._state_mtime()
+
+    def _current(self, user_id):
+        ids = set(self._by_user.get(SHARED_FEED, ()))
+        if user_id:
+            ids |= self._by_user.get(user_id, set())
+        return [n for problem_id in ids for n in self._items.get(problem_id, [])]
+
+    def feed(self, user_id):
+        """The user's notifications with their read flag, most urgent first"""
+        if self._today is None:
+            self.materialize()
+        with self._lock:
+            self._load_state()
+            read = self._read.get(user_id or SHARED_FEED, {})
+            notifications = [dict(n, read=n['id'] in read) for n in self._current(user_id)]
+        notifications.sort(key=lambda n: (PRIORITY_ORDER[n['priority']], n['date'], n['id']))
+        return notifications
+
+    def mark_read(self, user_id, ids=None):
+        """Mark the given notification ids (default: all current ones) as read"""
+        if self._today is None:
+            self.materialize()
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self._load_state()
+            current = {n['id'] for n in self._current(user_id)}
+            key = user_id or SHARED_FEED
+            # Forget notifications that are gone so the state stays small
+            read = {i: at for i, at in self._read.get(key, {}).items() if i in current}
+            for notification_id in current if ids is None else set(ids) & current:
+                read.setdefault(notification_id, now)
+            self._read[key] = read
+            self._save_state()
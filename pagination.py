@@ -0,0 +1,132 @@
+import base64
+import heapq
+import json
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# Sortable problem fields; every sort is tie-broken by id
+SORT_FIELDS = ('id', 'title', 'category', 'status', 'created_date', 'due_date', 'total_time')
+
+class PaginationError(ValueError):
+    pass
+
+def encode_cursor(sort, key):
+    data = json.dumps({'s': sort, 'k': key}, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        key = data['k']
+    except (ValueError, KeyError, TypeError):
+        raise PaginationError('Invalid cursor')
+    if data.get('s') != sort:
+        raise PaginationError('Cursor was issued for a different sort order')
+    return _as_key(key)
+
+def _as_key(value):
+    # JSON turns the key tuples into lists
+    return tuple(_as_key(v) for v in value) if isinstance(value, list) else value
+
+def parse_fields(args):
+    """The fields= projection as a list, or None for whole problems"""
+    fields = args.get('fields')
+    if not fields:
+        return None
+    return [field for field in fields.split(',') if field]
+
+def parse_page_args(args, sorts=SORT_FIELDS, default_sort='id'):
+    """Read limit, cursor, sort and order from request args
+
+    The sort name is prefixed with '-' for descending order, so it can be
+    stored in the cursor as one value.
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise PaginationError('limit must be a number')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+
+    sort = args.get('sort') or default_sort
+    descending = sort.startswith('-') or args.get('order') == 'desc'
+    sort = sort.lstrip('-')
+    if sort not in sorts:
+        raise PaginationError(f'Cannot sort by {sort}')
+    sort = '-' + sort if descending else sort
+
+    cursor = args.get('cursor')
+    return {
+        'limit': min(limit, MAX_LIMIT),
+        'sort': sort,
+        'after': decode_cursor(cursor, sort) if cursor else None
+    }
+
+def wants_page(args):
+    return any(name in args for name in ('limit', 'cursor', 'sort'))
+
+def field_key(field, descending=False):
+    """Sort key for a problem field; missing values sort last in either order"""
+    def key(problem):
+        value = problem.get(field)
+        # Descending pages take the largest keys, so there missing values rank lowest
+        last = value is not None if descending else value is None
+        return (last, value, problem['id'])
+    return key
+
+def project(problem, fields):
+    if fields is None:
+        return problem
+    projected = {'id': problem['id']}
+    for field in fields:
+        if field in problem:
+            projected[field] = problem[field]
+    return projected
+
+def paginate(problems, limit, sort, after=None, fields=None, key=None):
+    """Return one keyset page: {'items': [...], 'next_cursor': ...}
+
+    key maps a problem to its sort key (by default the sort field followed
+    by the id). Only the page itself is sorted, so a page out of n matching
+    problems costs O(n log limit).
+    """
+    descending = sort.startswith('-')
+    key = key or field_key(sort.lstrip('-'), descending)
+    if after is not None:
+        if descending:
+            problems = (p for p in problems if key(p) < after)
+        else:
+            problems = (p for p in problems if key(p) > after)
+    select = heapq.nlargest if descending else heapq.nsmallest
+    page = select(limit + 1, problems, key=key)
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(sort, key(page[-1]))
+    return {
+        'items': [project(problem, fields) for problem in page],
+        'next_cursor': next_cursor
+    }
+
+def page_from_args(problems, args, scores=None, always=False):
+    """Apply the request's fields=, limit, cursor and sort args to problems
+
+    Without limit, cursor or sort the whole list is returned (projected)
+    unless always is set. When search scores are given, 'relevance' becomes the
+    default sort. Raises PaginationError for invalid args.
+    """
+    fields = parse_fields(args)
+    if not always and not wants_page(args):
+        return [project(problem, fields) for problem in problems]
+
+    if scores is None:
+        page = parse_page_args(args)
+    else:
+        page = parse_page_args(args, SORT_FIELDS + ('relevance',), default_sort='relevance')
+    key = None
+    if page['sort'].lstrip('-') == 'relevance':
+        key = lambda problem: (-scores[problem['id']], problem['id'])
+    return paginate(problems, fields=fields, key=key, **page)
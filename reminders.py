@@ -0,0 +1,193 @@
+"""Due-date reminders kept in a priority queue
+
+Every open problem with a due date has one queue entry per configured
+"days before" value (data/reminder_settings.json, default 7, 3 and 1),
+ordered by the time it should fire. Entries are pushed when a problem's
+due date or status changes and popped once due, so a run only touches
+the reminders that fire. Outdated entries are not removed from the heap;
+they are recognised and dropped when popped: every scheduling of a problem
+gets a new generation number, and only entries of the current one fire.
+
+The time of the last run is kept in data/reminder_state.json: after a
+restart the queue is rebuilt from the problems and reminders that fired
+while the app was down are sent once, while those already sent are not.
+"""
+import heapq
+import itertools
+import json
+import os
+import threading
+from datetime import date, datetime
+
+from store import atomic_write_json
+
+REMINDER_SETTINGS_FILE = 'data/reminder_settings.json'
+REMINDER_STATE_FILE = 'data/reminder_state.json'
+
+DEFAULT_DAYS_BEFORE = (7, 3, 1)
+# Reminders fire at this hour of the day
+REMINDER_TIME = '09:00:00'
+
+# Rebuild the heap when it holds this many times more entries than are live
+COMPACT_RATIO = 2
+
+def _due_date(problem):
+    """Ordinal of the due date reminders are scheduled for, None if none are needed"""
+    if problem is None or problem.get('status') == 'closed':
+        return None
+    try:
+        return date.fromisoformat(problem['due_date']).toordinal()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def fired_through(timestamp):
+    """Ordinal of the last day whose reminders are due by timestamp"""
+    day = date.fromisoformat(timestamp[:10]).toordinal()
+    return day if timestamp[11:] >= REMINDER_TIME else day - 1
+
+def load_days_before(path=REMINDER_SETTINGS_FILE):
+    """The configured days_before values, largest first"""
+    try:
+        with open(path, 'r') as f:
+            values = json.load(f).get('days_before', [])
+    except (FileNotFoundError, ValueError):
+        values = []
+    days = set()
+    for value in values:
+        try:
+            days.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return tuple(sorted(days, reverse=True)) or DEFAULT_DAYS_BEFORE
+
+class ReminderScheduler:
+    """Calls send(reminders) with the (problem, days_before) pairs that came due"""
+
+    def __init__(self, store, send, settings_file=REMINDER_SETTINGS_FILE,
+                 state_file=REMINDER_STATE_FILE):
+        self.store = store
+        self.send = send
+        self.settings_file = settings_file
+        self.state_file = state_file
+        self._lock = threading.RLock()
+        self._heap = []
+        # problem id -> (due date ordinal, generation of its queue entries)
+        self._due = {}
+        self._generations = itertools.count()
+        self._settings_stamp = None
+        self._days_before = load_days_before(settings_file)
+        # Without saved state nothing that fired in the past is sent
+        self._last_run = self._load_state() or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        store.add_listener(self)
+
+    # Persistent state
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f).get('last_run')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_state(self):
+        atomic_write_json(self.state_file, {'last_run': self._last_run}, indent=4)
+
+    def _check_settings(self):
+        """Reschedule everything if the reminder settings changed on disk"""
+        try:
+            stamp = os.stat(self.settings_file).st_mtime_ns
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._settings_stamp:
+            return
+        self._settings_stamp = stamp
+        days_before = load_days_before(self.settings_file)
+        if days_before != self._days_before:
+            self._days_before = days_before
+            self._rebuild()
+
+    # Queue
+
+    def _entries(self, problem_id, scheduled):
+        """Heap entries (fire day, id, generation, days before) not fired yet"""
+        due_date, generation = scheduled
+        fired = fired_through(self._last_run)
+        for days_before in self._days_before:
+            if due_date - days_before > fired:
+                yield (due_date - days_before, problem_id, generation, days_before)
+
+    def _rebuild(self):
+        # Entries already in the heap are dropped, so the current generations stay valid
+        self._heap = [entry for problem_id, scheduled in self._due.items()
+                      for entry in self._entries(problem_id, scheduled)]
+        heapq.heapify(self._heap)
+
+    def _schedule(self, problem_id, due_date):
+        if due_date == self._due.get(problem_id, (None,))[0]:
+            return
+        if due_date is None:
+            self._due.pop(problem_id, None)
+            return
+        # A new generation outdates the entries pushed for earlier due dates,
+        # also when the problem comes back to one of them
+        scheduled = self._due[problem_id] = (due_date, next(self._generations))
+        for entry in self._entries(problem_id, scheduled):
+            heapq.heappush(self._heap, entry)
+        if len(self._heap) > COMPACT_RATIO * len(self._days_before) * max(len(self._due), 1):
+            self._rebuild()
+
+    def _live(self, entry):
+        day, problem_id, generation, days_before = entry
+        scheduled = self._due.get(problem_id)
+        return (scheduled is not None and scheduled[1] == generation
+                and days_before in self._days_before)
+
+    # Store listener
+
+    def reset(self, problems):
+        with self._lock:
+            self._due = {}
+            for problem in problems:
+                due_date = _due_date(problem)
+                if due_date is not None:
+                    self._due[problem['id']] = (due_date, next(self._generations))
+            self._rebuild()
+
+    def update(self, old, new):
+        with self._lock:
+            if new is None:
+                self._schedule(old['id'], None)
+            else:
+                self._schedule(new['id'], _due_date(new))
+
+    # Firing
+
+    def run_due(self, now=None):
+        """Send the reminders due by now; run periodically by the scheduler"""
+        now = (now or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+        self.store.refresh()
+        with self._lock:
+            self._check_settings()
+            # Another process may have sent reminders since our last run
+            saved = self._load_state()
+            if saved is not None and saved > self._last_run:
+                through = fired_through(saved)
+                while self._heap and self._heap[0][0] <= through:
+                    heapq.heappop(self._heap)
+                self._last_run = saved
+            fired = []
+            through = fired_through(now)
+            while self._heap and self._heap[0][0] <= through:
+                entry = heapq.heappop(self._heap)
+                if self._live(entry):
+                    fired.append((entry[1], entry[3]))
+            self._last_run = now
+            self._save_state()
+
+        # Sent without holding our lock: store updates call update() while
+        # holding the store's lock
+        reminders = [(self.store.get(problem_id), days_before) for problem_id, days_before in fired]
+        reminders = [(problem, days_before) for problem, days_before in reminders if problem is not None]
+        if reminders:
+            self.send(reminders)
+        return len(reminders)
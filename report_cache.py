@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+# How long (seconds) a stale result may still be served while it is recomputed
+MAX_STALE = 600
+
+class ReportCache:
+    """Report results cached per data version, with stale-while-revalidate
+
+    A result is fresh while the store version (and the date, since reports
+    depend on today) is unchanged. A stale result that was last seen fresh
+    less than max_stale seconds ago is returned at once while a single
+    background recomputation runs; otherwise callers wait for that one
+    computation instead of each running their own.
+    """
+
+    def __init__(self, store, max_stale=MAX_STALE, workers=1):
+        self.store = store
+        self.max_stale = max_stale
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report')
+        self._lock = threading.Lock()
+        self._reports = {}
+        self._results = {}
+        self._pending = {}
+
+    def register(self, name, compute):
+        """Register compute() as the report called name"""
+        self._reports[name] = compute
+
+    def _key(self):
+        self.store.refresh()
+        return (self.store.version, date.today().toordinal())
+
+    def _start(self, name, key):
+        """Start computing a report unless it already is; returns the future"""
+        with self._lock:
+            future = self._pending.get(name)
+            if future is None:
+                future = self._executor.submit(self._compute, name, key)
+                self._pending[name] = future
+            return future
+
+    def _compute(self, name, key):
+        try:
+            value = self._reports[name]()
+            with self._lock:
+                current = self._results.get(name)
+                if current is None or current[0] <= key:
+                    self._results[name] = (key, value, time.time())
+            return value
+        finally:
+            with self._lock:
+                self._pending.pop(name, None)
+
+    def get(self, name):
+        key = self._key()
+        with self._lock:
+            cached = self._results.get(name)
+        if cached is not None:
+            cached_key, value, fresh_at = cached
+            if cached_key == key:
+                with self._lock:
+                    self._results[name] = (key, value, time.time())
+                return value
+            if time.time() - fresh_at <= self.max_stale:
+                self._start(name, key)
+                return value
+        return self._start(name, key).result()
+
+    def refresh(self):
+        """Recompute stale reports in the background (scheduled job)"""
+        key = self._key()
+        for name in self._reports:
+            with self._lock:
+                cached = self._results.get(name)
+            if cached is None or cached[0] != key:
+                self._start(name, key)
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._results.clear()
+            else:
+                self._results.pop(name, None)
@@ -0,0 +1,338 @@
+"""Restore the data directory from a backup
+
+Restores a snapshot made by backup.py, or the state at a given time: the
+newest snapshot taken before that time plus the journal records written
+up to it, taken from the journals and journal archives (the records
+compaction removed from the journal) of later snapshots or of the live
+data directory. Files are
+streamed chunk by chunk into a staging directory next to the target and
+checked on the way (checksums, unique problem ids, contiguous journal,
+operations on existing problems, references to users, groups and
+problems); only then is the target swapped for the staging directory.
+The previous data directory is kept next to it.
+
+    python restore.py --list
+    python restore.py SNAPSHOT_ID [--target data] [--dry-run]
+    python restore.py --at "2026-10-18 09:30:00" [--target data] [--data-dir DIR] [--dry-run]
+
+Stop the app before restoring into its data directory.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import backup
+from jsonstream import iter_members
+from store import JOURNAL_ARCHIVE_FILE, JOURNAL_FILE, PROBLEMS_FILE
+
+PROBLEMS_NAME = os.path.basename(PROBLEMS_FILE)
+JOURNAL_NAME = os.path.basename(JOURNAL_FILE)
+ARCHIVE_NAME = os.path.basename(JOURNAL_ARCHIVE_FILE)
+LEGACY_PREFIX = 'backup_'
+# Number of reference warnings printed in full
+MAX_WARNINGS = 20
+
+class RestoreError(Exception):
+    pass
+
+def _timestamp(text):
+    datetime.strptime(text, '%Y-%m-%d %H:%M:%S')
+    return text
+
+def _file_blocks(path, size=1 << 20):
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(size)
+            if not data:
+                return
+            yield data
+
+def list_backups(backup_dir=backup.BACKUP_DIR):
+    """(id, created) of every snapshot, including old full-copy backup directories"""
+    backups = [(snapshot_id, datetime.strptime(snapshot_id, '%Y%m%d_%H%M%S'))
+               for snapshot_id in backup.list_snapshots(backup_dir)]
+    try:
+        names = os.listdir(backup_dir)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if name.startswith(LEGACY_PREFIX):
+            backups.append((name, datetime.strptime(name[len(LEGACY_PREFIX):], '%Y%m%d_%H%M%S')))
+    return sorted(backups, key=lambda b: b[1])
+
+def snapshot_sources(snapshot_id, backup_dir=backup.BACKUP_DIR):
+    """{filename: function returning the file's content as byte blocks}"""
+    if snapshot_id.startswith(LEGACY_PREFIX):
+        directory = os.path.join(backup_dir, snapshot_id)
+        return {name: (lambda path=os.path.join(directory, name): _file_blocks(path))
+                for name in sorted(os.listdir(directory))}
+    files = backup.load_manifest(snapshot_id, backup_dir)['files']
+    return {name: (lambda entry=entry: backup.read_file(entry, backup_dir))
+            for name, entry in files.items()}
+
+class Restore:
+    def __init__(self, backup_dir=backup.BACKUP_DIR, data_dir='data', out=sys.stdout):
+        self.backup_dir = backup_dir
+        self.data_dir = data_dir
+        self.out = out
+        self.ids = set()
+        self.owners = {}
+        self.groups = {}
+        self.position = 0
+        self.warnings = []
+
+    def _warn(self, message):
+        self.warnings.append(message)
+        if len(self.warnings) <= MAX_WARNINGS:
+            print(f'warning: {message}', file=self.out)
+
+    # Problems
+
+    def _track(self, problem):
+        self.owners[problem['id']] = problem.get('owner_id')
+        self.groups[problem['id']] = problem.get('group_id')
+
+    def _load_problems(self, path):
+        """Stream-check the restored snapshot file
+
+        Duplicate ids (left by the old id allocation) are renumbered the way
+        the store does when it loads the file, so the journal records that
+        follow refer to the same problems.
+        """
+        sequence = 0
+        duplicates = []
+        with open(path, 'r') as f:
+            for key, value in iter_members(f, stream_keys=('problems',)):
+                if key == 'journal_seq':
+                    self.position = value
+                elif key == 'sequences':
+                    sequence = max(sequence, value.get('problem', 0))
+                if key != 'problems':
+                    continue
+                problem_id = value.get('id')
+                if not isinstance(problem_id, int):
+                    raise RestoreError(f'{PROBLEMS_NAME}: problem without a valid id: {problem_id!r}')
+                sequence = max(sequence, problem_id)
+                if problem_id in self.ids:
+                    duplicates.append(value)
+                    continue
+                self.ids.add(problem_id)
+                self._track(value)
+        for problem in duplicates:
+            sequence += 1
+            self._warn(f'{PROBLEMS_NAME}: duplicate problem id {problem["id"]}, renumbered to {sequence} on load')
+            problem['id'] = sequence
+            self.ids.add(sequence)
+            self._track(problem)
+
+    def _apply(self, record):
+        """Check a journal record against the problems restored so far"""
+        seq = record.get('seq')
+        if not isinstance(seq, int) or seq <= self.position:
+            # Already contained in the snapshot file
+            return
+        for op in record.get('ops', []):
+            if op['op'] == 'insert':
+                problem = op['problem']
+                if problem['id'] in self.ids:
+                    raise RestoreError(f'journal seq {seq}: insert of existing problem {problem["id"]}')
+                self.ids.add(problem['id'])
+                self._track(problem)
+            elif op['id'] not in self.ids:
+                self._warn(f'journal seq {seq}: {op["op"]} of missing problem {op["id"]}')
+            elif op['op'] == 'delete':
+                self.ids.discard(op['id'])
+                self.owners.pop(op['id'], None)
+                self.groups.pop(op['id'], None)
+            elif op['op'] == 'update':
+                if 'owner_id' in op['fields']:
+                    self.owners[op['id']] = op['fields']['owner_id']
+                if 'group_id' in op['fields']:
+                    self.groups[op['id']] = op['fields']['group_id']
+        self.position = seq
+
+    def _journal_records(self, blocks, name):
+        for line in backup.iter_lines(blocks):
+            if not line.endswith(b'\n'):
+                # A record still being written when the file was captured
+                return
+            try:
+                yield json.loads(line), line
+            except ValueError:
+                raise RestoreError(f'{name}: unreadable journal record')
+
+    def _write_journal(self, path, blocks, later, until):
+        """Write the snapshot's journal plus later records up to until; returns the count replayed
+
+        Raises RestoreError if later records exist but the sources do not
+        continue from the snapshot up to until.
+        """
+        replayed = 0
+        latest = 0
+        with open(path, 'wb') as f:
+            if blocks is not None:
+                for record, line in self._journal_records(blocks, JOURNAL_NAME):
+                    if record['seq'] > self.position + 1:
+                        raise RestoreError(f'{JOURNAL_NAME}: records missing before seq {record["seq"]}')
+                    self._apply(record)
+                    f.write(line)
+            for name, source in later:
+                for record, line in self._journal_records(source(), name):
+                    latest = max(latest, record['seq'])
+                    if record['seq'] <= self.position:
+                        continue
+                    if record['seq'] != self.position + 1:
+                        # This source does not continue where we are; a later one may
+                        break
+                    if record.get('ts', '') > until:
+                        return replayed
+                    self._apply(record)
+                    f.write(line)
+                    replayed += 1
+        if latest > self.position:
+            raise RestoreError(f'journal records after seq {self.position} are missing, '
+                               f'the state at {until} cannot be rebuilt')
+        return replayed
+
+    # References between the documents
+
+    def _load(self, directory, name, default):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            return default
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _check_references(self, directory):
+        users = self._load(directory, 'users.json', None)
+        groups = self._load(directory, 'groups.json', {'groups': []})
+        permissions = self._load(directory, 'permissions.json', {})
+        group_ids = {str(group['id']) for group in groups.get('groups', [])}
+
+        for problem_id, owner in self.owners.items():
+            if users is not None and owner is not None and owner not in users:
+                self._warn(f'problem {problem_id}: owner {owner!r} is not a user')
+        for problem_id, group_id in self.groups.items():
+            if group_id not in (None, '') and str(group_id) not in group_ids:
+                self._warn(f'problem {problem_id}: group {group_id!r} does not exist')
+        for resource_id, entries in permissions.items():
+            try:
+                resource_id = int(resource_id)
+            except ValueError:
+                pass
+            if resource_id not in self.ids:
+                self._warn(f'permissions: shared problem {resource_id!r} does not exist')
+            for entry in entries:
+                if users is not None and entry.get('user_id') not in users:
+                    self._warn(f'permissions: user {entry.get("user_id")!r} does not exist')
+
+    # Running
+
+    def _later_journals(self, base_created):
+        """Journal sources that may continue the base snapshot, oldest first"""
+        sources = []
+        for snapshot_id, created in list_backups(self.backup_dir):
+            if created > base_created:
+                files = snapshot_sources(snapshot_id, self.backup_dir)
+                for name in (ARCHIVE_NAME, JOURNAL_NAME):
+                    if name in files:
+                        sources.append((f'{snapshot_id}/{name}', files[name]))
+        for name in (ARCHIVE_NAME, JOURNAL_NAME):
+            live = os.path.join(self.data_dir, name)
+            if os.path.exists(live):
+                sources.append((live, lambda live=live: _file_blocks(live)))
+        return sources
+
+    def run(self, snapshot_id=None, at=None, target='data', dry_run=False):
+        started = time.time()
+        backups = list_backups(self.backup_dir)
+        if at is not None:
+            candidates = [b for b in backups if b[1] <= datetime.strptime(at, '%Y-%m-%d %H:%M:%S')]
+            if not candidates:
+                raise RestoreError(f'No backup older than {at}')
+            snapshot_id, created = candidates[-1]
+        else:
+            created = dict(backups).get(snapshot_id)
+            if created is None:
+                raise RestoreError(f'No backup {snapshot_id!r}')
+        print(f'Restoring {snapshot_id}' + (f' and the journal up to {at}' if at else ''), file=self.out)
+
+        staging = f'{target.rstrip(os.sep)}.restore-{os.getpid()}'
+        os.makedirs(staging)
+        try:
+            sources = snapshot_sources(snapshot_id, self.backup_dir)
+            if at is not None and 'problems.db' in sources:
+                raise RestoreError('Point-in-time restore needs the JSON storage backend journal')
+            size = 0
+            for name, source in sources.items():
+                if name == JOURNAL_NAME:
+                    continue
+                with open(os.path.join(staging, name), 'wb') as f:
+                    for data in source():
+                        f.write(data)
+                size += os.path.getsize(os.path.join(staging, name))
+            copied = time.time()
+            print(f'  {len(sources)} files, {size / 1e6:.1f} MB streamed in {copied - started:.2f}s', file=self.out)
+
+            if os.path.exists(os.path.join(staging, PROBLEMS_NAME)):
+                self._load_problems(os.path.join(staging, PROBLEMS_NAME))
+            if JOURNAL_NAME in sources or at is not None:
+                later = self._later_journals(created) if at is not None else []
+                replayed = self._write_journal(os.path.join(staging, JOURNAL_NAME),
+                                               sources[JOURNAL_NAME]() if JOURNAL_NAME in sources else None,
+                                               later, at or '')
+                if at is not None:
+                    print(f'  {replayed} journal records replayed up to {at}', file=self.out)
+            self._check_references(staging)
+            checked = time.time()
+            print(f'  {len(self.ids)} problems at journal seq {self.position} checked in '
+                  f'{checked - copied:.2f}s, {len(self.warnings)} warnings', file=self.out)
+
+            if dry_run:
+                shutil.rmtree(staging)
+            else:
+                if os.path.exists(target) and os.listdir(target):
+                    kept = f'{target.rstrip(os.sep)}.before-restore-{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+                    os.rename(target, kept)
+                    print(f'  previous data kept in {kept}', file=self.out)
+                elif os.path.exists(target):
+                    os.rmdir(target)
+                os.rename(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        print(f'{"Checked" if dry_run else "Restored"} in {time.time() - started:.2f}s', file=self.out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Restore the data directory from a backup')
+    parser.add_argument('snapshot_id', nargs='?')
+    parser.add_argument('--at', type=_timestamp,
+                        help='restore the state at this time (YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--list', action='store_true', help='list the available backups')
+    parser.add_argument('--target', default='data', help='directory to restore into')
+    parser.add_argument('--data-dir',
+                        help='live data directory whose journal is replayed for --at (default: the target)')
+    parser.add_argument('--backup-dir', default=backup.BACKUP_DIR)
+    parser.add_argument('--dry-run', action='store_true',
+                        help='restore into a scratch directory, check it and delete it')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for snapshot_id, created in list_backups(args.backup_dir):
+            print(f'{snapshot_id}  {created}')
+        return 0
+    if bool(args.snapshot_id) == bool(args.at):
+        parser.error('give either a snapshot id or --at')
+    try:
+        Restore(args.backup_dir, args.data_dir or args.target).run(args.snapshot_id, args.at, args.target, args.dry_run)
+    except RestoreError as e:
+        print(f'Restore failed: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
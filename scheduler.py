@@ -0,0 +1,161 @@
+"""Periodic jobs of the application
+
+One scheduler thread per process decides when jobs are due and hands them
+to a worker pool, so a slow job does not hold up the others. A job that is
+still running when it comes due again is skipped rather than started a
+second time. Per job the scheduler records runs, skips, failures,
+duration and lateness (how long after its planned time a run started).
+
+Jobs that act on shared data (compaction, backups, reminders) must run in
+one process only when the app is served by several workers: they are
+registered with shared=True and run only in the process holding the
+scheduler lock file. The other processes keep trying to take the lock, so
+if that process exits one of them takes over. Jobs that refresh
+in-memory state run in every process.
+"""
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import schedule
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+SCHEDULER_LOCK_FILE = 'data/scheduler.lock'
+SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS', 4))
+# Longest sleep of the scheduler thread between checks (seconds)
+TICK = 1
+
+class Scheduler:
+    def __init__(self, workers=SCHEDULER_WORKERS, lock_path=SCHEDULER_LOCK_FILE):
+        self.lock_path = lock_path
+        self._schedule = schedule.Scheduler()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._running = set()
+        self._metrics = {}
+        self._lock_file = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def every(self, interval=1):
+        """Start a schedule for register(), e.g. every(10).minutes"""
+        return self._schedule.every(interval)
+
+    def register(self, name, job, func, shared=False):
+        """Run func on the given schedule under name
+
+        shared jobs run only in the process holding the scheduler lock.
+        """
+        job.do(self._submit, name, func, job, shared)
+        self._metrics[name] = {
+            'shared': shared,
+            'runs': 0,
+            'failures': 0,
+            'skipped': 0,
+            'last_started': None,
+            'last_duration': None,
+            'max_duration': 0,
+            'total_duration': 0,
+            'last_lateness': None,
+            'max_lateness': 0,
+            'last_error': None
+        }
+
+    # Process group leadership
+
+    def _try_lock(self):
+        """Whether this process holds the scheduler lock (taking it if free)"""
+        if fcntl is None:
+            return True
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def is_leader(self):
+        return fcntl is None or self._lock_file is not None
+
+    # Running jobs
+
+    def _submit(self, name, func, job, shared):
+        # Still the planned time: schedule moves next_run after this call
+        lateness = max((datetime.now() - job.next_run).total_seconds(), 0)
+        with self._lock:
+            if shared and not self.is_leader():
+                return
+            if name in self._running:
+                self._metrics[name]['skipped'] += 1
+                return
+            self._running.add(name)
+        self._executor.submit(self._run, name, func, lateness)
+
+    def _run(self, name, func, lateness):
+        started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        started = time.monotonic()
+        error = None
+        try:
+            func()
+        except Exception as e:
+            error = repr(e)
+            traceback.print_exc()
+        duration = time.monotonic() - started
+        with self._lock:
+            self._running.discard(name)
+            metrics = self._metrics[name]
+            metrics['runs'] += 1
+            metrics['last_started'] = started_at
+            metrics['last_duration'] = duration
+            metrics['max_duration'] = max(metrics['max_duration'], duration)
+            metrics['total_duration'] += duration
+            metrics['last_lateness'] = lateness
+            metrics['max_lateness'] = max(metrics['max_lateness'], lateness)
+            if error is not None:
+                metrics['failures'] += 1
+                metrics['last_error'] = error
+
+    def metrics(self):
+        """Per-job execution metrics, plus whether this process runs shared jobs"""
+        with self._lock:
+            jobs = {}
+            for name, metrics in self._metrics.items():
+                jobs[name] = dict(metrics, running=name in self._running)
+                runs = metrics['runs']
+                jobs[name]['avg_duration'] = metrics['total_duration'] / runs if runs else None
+            return {'leader': self.is_leader(), 'pid': os.getpid(), 'jobs': jobs}
+
+    # Scheduler thread
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._try_lock()
+            self._schedule.run_pending()
+            idle = self._schedule.idle_seconds
+            self._stop.wait(TICK if idle is None else min(max(idle, 0), TICK))
+
+    def start(self):
+        """Start the scheduler thread (once per process)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
@@ -0,0 +1,196 @@
+import bisect
+import math
+import re
+import threading
+from collections import Counter
+
+# Niqqud and cantillation marks
+_MARKS = re.compile('[\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7]')
+# Quotes used inside Hebrew abbreviations (צה"ל, צ'ק)
+_QUOTES = re.compile('["\'\u05F3\u05F4]')
+_TOKEN = re.compile(r'\w+')
+_FINAL_LETTERS = str.maketrans('ךםןףץ', 'כמנפצ')
+_PREFIX_LETTERS = set('והבלמשכ')
+_HEBREW_LETTER = re.compile('[\u05D0-\u05EA]')
+
+# Up to this many prefix letters are stripped from a word ("ושכש...")
+MAX_PREFIX = 3
+# Prefixes are not stripped below this many letters: shorter remainders
+# ('שלומ' -> 'ומ') match unrelated words
+MIN_STEM = 3
+# A stripped prefix variant counts for less than the word as written
+PREFIX_WEIGHT = 0.5
+
+# Completions considered for the last (partially typed) query word
+MAX_COMPLETIONS = 50
+
+# Weight of each indexed text, per field
+TEXT_FIELDS = {'title': 3.0, 'tags': 2.0, 'description': 1.0}
+LIST_FIELDS = {'comments': ('text', 1.0), 'solutions': ('description', 1.0)}
+
+def normalize(text):
+    """Lowercase, strip niqqud and quotes and unify final letters"""
+    text = _MARKS.sub('', text.lower())
+    text = _QUOTES.sub('', text)
+    return text.translate(_FINAL_LETTERS)
+
+def variants(token):
+    """The token plus its forms with Hebrew prefix letters removed"""
+    yield token
+    if not _HEBREW_LETTER.match(token):
+        return
+    for i in range(1, MAX_PREFIX + 1):
+        if len(token) - i < MIN_STEM or token[i - 1] not in _PREFIX_LETTERS:
+            return
+        yield token[i:]
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))
+
+def term_weights(text, weight):
+    """Counter of index terms for a piece of text"""
+    terms = Counter()
+    for token in tokenize(text):
+        for i, term in enumerate(variants(token)):
+            terms[term] += weight if i == 0 else weight * PREFIX_WEIGHT
+    return terms
+
+def _field_text(problem, field):
+    value = problem.get(field) or ''
+    return ' '.join(value) if isinstance(value, list) else str(value)
+
+class SearchIndex:
+    """Incrementally maintained inverted index over problem texts
+
+    Indexes titles, tags, descriptions, comments and solution descriptions
+    with Hebrew normalization and prefix handling. Results are ranked by
+    field weight times inverse document frequency.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._fields = {}
+        self._vocabulary = []
+        store.add_listener(self)
+
+    def _add_terms(self, problem_id, terms, sign):
+        for term, weight in terms.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = {}
+                i = bisect.bisect_left(self._vocabulary, term)
+                if i == len(self._vocabulary) or self._vocabulary[i] != term:
+                    self._vocabulary.insert(i, term)
+            score = posting.get(problem_id, 0) + sign * weight
+            if score > 1e-9:
+                posting[problem_id] = score
+            else:
+                posting.pop(problem_id, None)
+                if not posting:
+                    del self._postings[term]
+
+    def _set_field(self, problem_id, field, terms):
+        fields = self._fields.setdefault(problem_id, {})
+        old = fields.get(field)
+        if old:
+            self._add_terms(problem_id, old, -1)
+        self._add_terms(problem_id, terms, 1)
+        fields[field] = terms
+
+    def _list_terms(self, items, key, weight):
+        terms = Counter()
+        for item in items:
+            terms.update(term_weights(str(item.get(key) or ''), weight))
+        return terms
+
+    def _index(self, old, new):
+        problem_id = new['id']
+        for field, weight in TEXT_FIELDS.items():
+            if old is None or old.get(field) != new.get(field):
+                self._set_field(problem_id, field, term_weights(_field_text(new, field), weight))
+        for field, (key, weight) in LIST_FIELDS.items():
+            old_items = old.get(field, []) if old else []
+            new_items = new.get(field, [])
+            if old is not None and old_items == new_items:
+                continue
+            if old is not None and new_items[:len(old_items)] == old_items:
+                # Only appended items need tokenizing
+                added = self._list_terms(new_items[len(old_items):], key, weight)
+                self._add_terms(problem_id, added, 1)
+                self._fields[problem_id][field].update(added)
+            else:
+                self._set_field(problem_id, field, self._list_terms(new_items, key, weight))
+
+    def _remove(self, problem_id):
+        for terms in self._fields.pop(problem_id, {}).values():
+            self._add_terms(problem_id, terms, -1)
+
+    def reset(self, problems):
+        with self._lock:
+            self._postings = {}
+            self._fields = {}
+            self._vocabulary = []
+            for problem in problems:
+                self._index(None, problem)
+
+    def update(self, old, new):
+        with self._lock:
+            if old is not None and (new is None or old['id'] != new['id']):
+                self._remove(old['id'])
+                old = None
+            if new is not None:
+                self._index(old, new)
+
+    def _expand(self, token, complete):
+        """Map the index terms a query token may match to a score factor"""
+        terms = {}
+        for n, variant in enumerate(variants(token)):
+            factor = 1.0 if n == 0 else PREFIX_WEIGHT
+            if variant in self._postings:
+                terms.setdefault(variant, factor)
+            if complete and n == 0:
+                # Only the word as typed is completed: completing a stripped
+                # variant ("משה" -> "שה") matches unrelated words ("שהיה")
+                i = bisect.bisect_left(self._vocabulary, variant)
+                found = 0
+                while i < len(self._vocabulary) and found < MAX_COMPLETIONS:
+                    term = self._vocabulary[i]
+                    if not term.startswith(variant):
+                        break
+                    if term in self._postings:
+                        terms.setdefault(term, factor * PREFIX_WEIGHT)
+                        found += 1
+                    i += 1
+        return terms
+
+    def search(self, query, limit=None):
+        """Return [(problem_id, score)] of problems matching every query word
+
+        The last word also matches as a prefix so results update as you type.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self.store.refresh()
+        with self._lock:
+            total = max(len(self._fields), 1)
+            scores = None
+            for position, token in enumerate(tokens):
+                token_scores = Counter()
+                expanded = self._expand(token, complete=position == len(tokens) - 1)
+                for term, factor in expanded.items():
+                    posting = self._postings[term]
+                    idf = math.log(1 + total / len(posting))
+                    for problem_id, weight in posting.items():
+                        if scores is None or problem_id in scores:
+                            token_scores[problem_id] = max(token_scores[problem_id], weight * idf * factor)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = Counter({pid: scores[pid] + s for pid, s in token_scores.items()})
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
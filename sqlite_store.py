@@ -0,0 +1,614 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from store import ITEM_SEQUENCES, activity_date, affected_ids, with_last_activity
+
+# Problem fields stored as their own (indexable) columns
+PROBLEM_COLUMNS = (
+    'title', 'category', 'description', 'status', 'created_date', 'due_date',
+    'owner_id', 'group_id', 'visibility', 'total_time'
+)
+
+# Problem lists stored in child tables
+CHILD_TABLES = ('subtasks', 'comments', 'solutions', 'time_logs', 'history')
+
+# Versions kept in the change log; a process further behind reloads everything
+CHANGE_LOG_VERSIONS = 10000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS problems (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    category TEXT,
+    description TEXT,
+    status TEXT,
+    created_date TEXT,
+    due_date TEXT,
+    owner_id TEXT,
+    group_id TEXT,
+    visibility TEXT,
+    total_time INTEGER,
+    tags TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_problems_status ON problems (status);
+CREATE INDEX IF NOT EXISTS idx_problems_category ON problems (category);
+CREATE INDEX IF NOT EXISTS idx_problems_due_date ON problems (due_date);
+CREATE INDEX IF NOT EXISTS idx_problems_created_date ON problems (created_date);
+CREATE INDEX IF NOT EXISTS idx_problems_owner_id ON problems (owner_id);
+CREATE INDEX IF NOT EXISTS idx_problems_group_id ON problems (group_id);
+
+CREATE TABLE IF NOT EXISTS problem_tags (
+    problem_id INTEGER NOT NULL REFERENCES problems (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_problem_tags_tag ON problem_tags (tag);
+CREATE INDEX IF NOT EXISTS idx_problem_tags_problem ON problem_tags (problem_id);
+
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER NOT NULL,
+    problem_id INTEGER NOT NULL,
+    old TEXT,
+    new TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_changes_version ON changes (version);
+
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('acl_version', 0);
+
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS permissions (
+    resource_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_permissions_resource ON permissions (resource_id);
+CREATE INDEX IF NOT EXISTS idx_permissions_user ON permissions (user_id);
+
+CREATE TABLE IF NOT EXISTS groups (
+    id INTEGER PRIMARY KEY,
+    creator_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS group_members (
+    group_id INTEGER NOT NULL REFERENCES groups (id) ON DELETE CASCADE,
+    member TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_group_members_member ON group_members (member);
+
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+''' + ''.join(f'''
+CREATE TABLE IF NOT EXISTS {table} (
+    problem_id INTEGER NOT NULL REFERENCES problems (id) ON DELETE CASCADE,
+    item_id INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_{table}_problem ON {table} (problem_id, item_id);
+''' for table in CHILD_TABLES)
+
+def _chunks(values, size=500):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+class SQLiteProblemStore:
+    """SQLite implementation of the ProblemStore interface
+
+    Problems live in an indexed table with one child table per list field,
+    so query() filters are pushed down to SQL. The users, permissions, groups
+    and templates documents are stored here as well when this backend is
+    selected.
+
+    Listeners get the same reset()/update() calls as with ProblemStore.
+    Every commit records the (old, new) problems it changed in the changes
+    table under the version it created; refresh() replays the changes of
+    other processes from there, and only resets the listeners when the log
+    no longer covers every version since their last update.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._cache = None
+        self._listeners = []
+        self._commit_hooks = []
+        self._listener_lock = threading.RLock()
+        self._listener_version = None
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a block in a single write transaction, yielding the connection"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _version(self, conn):
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    @property
+    def version(self):
+        """Counter bumped by every committed mutation"""
+        return self._version(self._connection())
+
+    # Reading
+
+    def _row_to_problem(self, row):
+        problem = {'id': row[0]}
+        for column, value in zip(PROBLEM_COLUMNS, row[1:]):
+            if value is not None:
+                problem[column] = value
+        tags, extra = row[-2], row[-1]
+        if tags is not None:
+            problem['tags'] = json.loads(tags)
+        if extra:
+            problem.update(json.loads(extra))
+        return problem
+
+    def _select(self, conn, where='', params=()):
+        columns = ', '.join(('id',) + PROBLEM_COLUMNS + ('tags', 'extra'))
+        rows = conn.execute(f'SELECT {columns} FROM problems {where} ORDER BY id', params)
+        problems = {row[0]: self._row_to_problem(row) for row in rows}
+        if not problems:
+            return []
+        ids = list(problems)
+        for table in CHILD_TABLES:
+            if where:
+                for chunk in _chunks(ids):
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = conn.execute(
+                        f'SELECT problem_id, data FROM {table} WHERE problem_id IN ({placeholders}) ORDER BY rowid',
+                        chunk
+                    )
+                    for problem_id, data in rows:
+                        problems[problem_id].setdefault(table, []).append(json.loads(data))
+            else:
+                for problem_id, data in conn.execute(f'SELECT problem_id, data FROM {table} ORDER BY rowid'):
+                    problems[problem_id].setdefault(table, []).append(json.loads(data))
+        return list(problems.values())
+
+    def _versioned_problems(self):
+        conn = self._connection()
+        cache = self._cache
+        if cache is None or cache[0] != self._version(conn):
+            conn.execute('BEGIN')
+            try:
+                cache = (self._version(conn), self._select(conn))
+            finally:
+                conn.execute('COMMIT')
+            self._cache = cache
+        return cache
+
+    def problems(self):
+        """Return all problems, cached until the next committed mutation"""
+        return self._versioned_problems()[1]
+
+    def get(self, problem_id):
+        """Return a single problem or None"""
+        return self._get(self._connection(), problem_id)
+
+    def iter_problems(self, batch_size=1000):
+        """Yield all problems in id order, reading batch_size at a time
+
+        Each batch is read in its own transaction, so memory stays bounded
+        by the batch size however large the table is.
+        """
+        conn = self._connection()
+        last_id = 0
+        while True:
+            conn.execute('BEGIN')
+            try:
+                batch = self._select(
+                    conn, 'WHERE id IN (SELECT id FROM problems WHERE id > ? ORDER BY id LIMIT ?)',
+                    (last_id, batch_size)
+                )
+            finally:
+                conn.execute('COMMIT')
+            if not batch:
+                return
+            yield from batch
+            last_id = batch[-1]['id']
+
+    def query(self, category=None, status=None, tags=None, owner_id=None, group_id=None,
+              created_from=None, due_from=None, due_to=None):
+        """Return problems matching all given filters using the table indexes"""
+        clauses, params = [], []
+        for column, value in (('category', category), ('status', status),
+                              ('owner_id', owner_id), ('group_id', group_id)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if created_from:
+            clauses.append('created_date >= ?')
+            params.append(created_from)
+        if due_from:
+            clauses.append('due_date >= ?')
+            params.append(due_from)
+        if due_to:
+            clauses.append('due_date <= ?')
+            params.append(due_to)
+        if tags:
+            tags = list(dict.fromkeys(tags))
+            placeholders = ','.join('?' * len(tags))
+            clauses.append(
+                f'id IN (SELECT problem_id FROM problem_tags WHERE tag IN ({placeholders}) '
+                'GROUP BY problem_id HAVING COUNT(DISTINCT tag) = ?)'
+            )
+            params.extend(tags)
+            params.append(len(tags))
+        if not clauses:
+            return self.problems()
+        return self._select(self._connection(), 'WHERE ' + ' AND '.join(clauses), params)
+
+    # Writing
+
+    def bump_version(self, conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def _allocate(self, conn, name):
+        conn.execute('INSERT OR IGNORE INTO sequences (name, value) VALUES (?, 0)', (name,))
+        conn.execute('UPDATE sequences SET value = value + 1 WHERE name = ?', (name,))
+        return conn.execute('SELECT value FROM sequences WHERE name = ?', (name,)).fetchone()[0]
+
+    def observe_sequence(self, conn, name, value):
+        """Move a sequence forward so it never hands out value again"""
+        if isinstance(value, int):
+            conn.execute('INSERT OR IGNORE INTO sequences (name, value) VALUES (?, 0)', (name,))
+            conn.execute('UPDATE sequences SET value = MAX(value, ?) WHERE name = ?', (value, name))
+
+    def _set_tags(self, conn, problem_id, tags):
+        conn.execute('DELETE FROM problem_tags WHERE problem_id = ?', (problem_id,))
+        conn.executemany(
+            'INSERT INTO problem_tags (problem_id, tag) VALUES (?, ?)',
+            [(problem_id, tag) for tag in dict.fromkeys(tags)]
+        )
+
+    def _insert_item(self, conn, problem_id, field, item):
+        name = ITEM_SEQUENCES.get(field)
+        if name:
+            if item.get('id') is None:
+                item['id'] = self._allocate(conn, name)
+            else:
+                self.observe_sequence(conn, name, item['id'])
+        conn.execute(
+            f'INSERT INTO {field} (problem_id, item_id, data) VALUES (?, ?, ?)',
+            (problem_id, item.get('id'), json.dumps(item, ensure_ascii=False))
+        )
+
+    def add_problem_row(self, conn, problem):
+        """Insert a full problem document (used by insert() and the migration tool)"""
+        if problem.get('id') is None:
+            problem['id'] = self._allocate(conn, 'problem')
+        else:
+            self.observe_sequence(conn, 'problem', problem['id'])
+        extra = {k: v for k, v in problem.items()
+                 if k not in PROBLEM_COLUMNS and k not in CHILD_TABLES and k not in ('id', 'tags')}
+        tags = problem.get('tags')
+        conn.execute(
+            f'INSERT INTO problems (id, {", ".join(PROBLEM_COLUMNS)}, tags, extra) '
+            f'VALUES ({",".join("?" * (len(PROBLEM_COLUMNS) + 3))})',
+            (problem['id'], *(problem.get(c) for c in PROBLEM_COLUMNS),
+             json.dumps(tags, ensure_ascii=False) if tags is not None else None,
+             json.dumps(extra, ensure_ascii=False) if extra else None)
+        )
+        if tags:
+            self._set_tags(conn, problem['id'], tags)
+        for field in CHILD_TABLES:
+            for item in problem.get(field, []):
+                self._insert_item(conn, problem['id'], field, item)
+
+    def _exists(self, conn, problem_id):
+        return conn.execute('SELECT 1 FROM problems WHERE id = ?', (problem_id,)).fetchone() is not None
+
+    def _update_fields(self, conn, problem_id, fields):
+        columns = {k: v for k, v in fields.items() if k in PROBLEM_COLUMNS}
+        if columns:
+            assignments = ', '.join(f'{k} = ?' for k in columns)
+            conn.execute(f'UPDATE problems SET {assignments} WHERE id = ?', (*columns.values(), problem_id))
+        if 'tags' in fields:
+            conn.execute('UPDATE problems SET tags = ? WHERE id = ?',
+                         (json.dumps(fields['tags'], ensure_ascii=False), problem_id))
+            self._set_tags(conn, problem_id, fields['tags'] or [])
+        others = {k: v for k, v in fields.items() if k not in PROBLEM_COLUMNS and k != 'tags'}
+        if others:
+            row = conn.execute('SELECT extra FROM problems WHERE id = ?', (problem_id,)).fetchone()
+            extra = json.loads(row[0]) if row[0] else {}
+            extra.update(others)
+            conn.execute('UPDATE problems SET extra = ? WHERE id = ?',
+                         (json.dumps(extra, ensure_ascii=False), problem_id))
+
+    def _append(self, conn, problem_id, field, item):
+        if field in CHILD_TABLES:
+            self._insert_item(conn, problem_id, field, item)
+            return
+        row = conn.execute('SELECT extra FROM problems WHERE id = ?', (problem_id,)).fetchone()
+        extra = json.loads(row[0]) if row[0] else {}
+        self._update_fields(conn, problem_id, {field: extra.get(field, []) + [item]})
+
+    def _update_item(self, conn, problem_id, field, item_id, fields):
+        row = conn.execute(
+            f'SELECT rowid, data FROM {field} WHERE problem_id = ? AND item_id = ? ORDER BY rowid LIMIT 1',
+            (problem_id, item_id)
+        ).fetchone()
+        if row is not None:
+            item = json.loads(row[1])
+            item.update(fields)
+            conn.execute(f'UPDATE {field} SET data = ? WHERE rowid = ?',
+                         (json.dumps(item, ensure_ascii=False), row[0]))
+
+    def apply_op(self, conn, op):
+        """Apply a ProblemStore journal operation inside a transaction"""
+        kind = op['op']
+        if kind == 'insert':
+            self.add_problem_row(conn, op['problem'])
+        elif kind == 'delete':
+            conn.execute('DELETE FROM problems WHERE id = ?', (op['id'],))
+        elif not self._exists(conn, op['id']):
+            return
+        elif kind == 'update':
+            self._update_fields(conn, op['id'], op['fields'])
+        elif kind == 'append':
+            self._append(conn, op['id'], op['field'], op['item'])
+        elif kind == 'update_item':
+            self._update_item(conn, op['id'], op['field'], op['item_id'], op['fields'])
+
+    def _get(self, conn, problem_id):
+        problems = self._select(conn, 'WHERE id = ?', (problem_id,))
+        return problems[0] if problems else None
+
+    def _log_changes(self, conn, version, changes):
+        conn.executemany(
+            'INSERT INTO changes (version, problem_id, old, new) VALUES (?, ?, ?, ?)',
+            [(version, (new or old)['id'],
+              json.dumps(old, ensure_ascii=False) if old is not None else None,
+              json.dumps(new, ensure_ascii=False) if new is not None else None)
+             for old, new in changes]
+        )
+        conn.execute('DELETE FROM changes WHERE version <= ?', (version - CHANGE_LOG_VERSIONS,))
+
+    def _commit(self, ops):
+        with self.transaction() as conn:
+            version = self._version(conn)
+            old = {op['id']: self._get(conn, op['id']) for op in ops if op['op'] != 'insert'}
+            for op in ops:
+                self.apply_op(conn, op)
+            self.bump_version(conn)
+            changes = [(old.get(problem_id), self._get(conn, problem_id)) for problem_id in affected_ids(ops)]
+            changes = [(old_problem, new_problem) for old_problem, new_problem in changes
+                       if old_problem is not None or new_problem is not None]
+            self._log_changes(conn, version + 1, changes)
+            for hook in self._commit_hooks:
+                hook(changes)
+        if self._listeners:
+            with self._listener_lock:
+                # Otherwise another writer got in between; refresh() replays
+                if self._listener_version == version:
+                    for old_problem, new_problem in changes:
+                        for listener in self._listeners:
+                            listener.update(old_problem, new_problem)
+                    self._listener_version = version + 1
+
+    def _logged_changes(self, since):
+        """(version, [(old, new)]) committed after since, or None if the log has gaps"""
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            version = self._version(conn)
+            rows = conn.execute(
+                'SELECT version, old, new FROM changes WHERE version > ? ORDER BY version, rowid', (since,)
+            ).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        # Every commit logs at least one change; versions bumped without one
+        # (migrations) or pruned from the log need a full reload
+        if len({row[0] for row in rows if row[0] <= version}) != version - since:
+            return None
+        changes = [(json.loads(old) if old is not None else None, json.loads(new) if new is not None else None)
+                   for row_version, old, new in rows if row_version <= version]
+        return version, changes
+
+    def refresh(self):
+        """Catch the listeners up with changes committed by other processes"""
+        if not self._listeners or self.version == self._listener_version:
+            return
+        with self._listener_lock:
+            logged = None
+            if self._listener_version is not None:
+                logged = self._logged_changes(self._listener_version)
+            if logged is not None:
+                version, changes = logged
+                for old_problem, new_problem in changes:
+                    for listener in self._listeners:
+                        listener.update(old_problem, new_problem)
+                self._listener_version = version
+                return
+            version, problems = self._versioned_problems()
+            if version != self._listener_version:
+                for listener in self._listeners:
+                    listener.reset(problems)
+                self._listener_version = version
+
+    def add_commit_hook(self, hook):
+        """Register hook(changes) for local commits (see ProblemStore)
+
+        Hooks run inside the write transaction, which holds the database
+        write lock.
+        """
+        self._commit_hooks.append(hook)
+
+    def add_listener(self, listener):
+        """Register an index kept in sync with the problems (see ProblemStore)"""
+        with self._listener_lock:
+            self._listeners.append(listener)
+            self._listener_version = None
+
+    def _with_history(self, problem_id, ops, history, fields=None):
+        fields = {**(fields or {}), 'last_activity': activity_date(history)}
+        ops.append({'op': 'update', 'id': problem_id, 'fields': fields})
+        if history is not None:
+            ops.append({'op': 'append', 'id': problem_id, 'field': 'history', 'item': history})
+        self._commit(ops)
+
+    def insert(self, problem):
+        """Add a new problem, allocating its id if it has none"""
+        self._commit([{'op': 'insert', 'problem': with_last_activity(problem)}])
+        return problem
+
+    def delete(self, problem_id):
+        """Remove a problem and its child rows"""
+        self._commit([{'op': 'delete', 'id': problem_id}])
+
+    def update(self, problem_id, fields, history=None):
+        """Set top-level fields of a problem, optionally recording a history entry"""
+        self._with_history(problem_id, [{'op': 'update', 'id': problem_id, 'fields': fields}], history)
+
+    def append(self, problem_id, field, item, history=None, fields=None):
+        """Append an item to one of a problem's lists"""
+        ops = [{'op': 'append', 'id': problem_id, 'field': field, 'item': item}]
+        self._with_history(problem_id, ops, history, fields)
+
+    def update_item(self, problem_id, field, item_id, fields, history=None):
+        """Update fields of an item inside one of a problem's lists"""
+        op = {'op': 'update_item', 'id': problem_id, 'field': field, 'item_id': item_id, 'fields': fields}
+        self._with_history(problem_id, [op], history)
+
+    def compact(self):
+        """Checkpoint the write-ahead log back into the database file"""
+        self._connection().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return True
+
+    @contextmanager
+    def snapshot_files(self):
+        """Copy the database with the online backup API and yield {filename: (file, length)}
+
+        The copy is made inside one read transaction, which in WAL mode does
+        not block writers.
+        """
+        tmp_path = f'{self.path}.{os.getpid()}.snapshot'
+        target = sqlite3.connect(tmp_path)
+        try:
+            self._connection().backup(target)
+        finally:
+            target.close()
+        try:
+            with open(tmp_path, 'rb') as f:
+                yield {os.path.basename(self.path): (f, os.fstat(f.fileno()).st_size)}
+        finally:
+            os.remove(tmp_path)
+
+    # Users, permissions, groups and templates documents
+
+    def add_user_row(self, conn, username, user):
+        conn.execute('INSERT OR REPLACE INTO users (username, data) VALUES (?, ?)',
+                     (username, json.dumps(user, ensure_ascii=False)))
+
+    def add_permission_rows(self, conn, resource_id, entries):
+        conn.executemany(
+            'INSERT INTO permissions (resource_id, user_id, data) VALUES (?, ?, ?)',
+            [(str(resource_id), p['user_id'], json.dumps(p, ensure_ascii=False)) for p in entries]
+        )
+
+    def add_group_row(self, conn, group):
+        conn.execute('INSERT OR REPLACE INTO groups (id, creator_id, data) VALUES (?, ?, ?)',
+                     (group['id'], group.get('creator_id'), json.dumps(group, ensure_ascii=False)))
+        conn.execute('DELETE FROM group_members WHERE group_id = ?', (group['id'],))
+        conn.executemany('INSERT INTO group_members (group_id, member) VALUES (?, ?)',
+                         [(group['id'], m) for m in group.get('members', [])])
+
+    def add_template_row(self, conn, template):
+        conn.execute('INSERT OR REPLACE INTO templates (id, data) VALUES (?, ?)',
+                     (template['id'], json.dumps(template, ensure_ascii=False)))
+
+    def load_users(self):
+        rows = self._connection().execute('SELECT username, data FROM users ORDER BY rowid')
+        return {username: json.loads(data) for username, data in rows}
+
+    def save_users(self, users):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM users')
+            for username, user in users.items():
+                self.add_user_row(conn, username, user)
+
+    def acl_version(self):
+        """Counter bumped whenever permissions or groups are saved"""
+        return self._connection().execute("SELECT value FROM meta WHERE key = 'acl_version'").fetchone()[0]
+
+    def _bump_acl_version(self, conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'acl_version'")
+
+    def load_permissions(self):
+        permissions = {}
+        rows = self._connection().execute('SELECT resource_id, data FROM permissions ORDER BY rowid')
+        for resource_id, data in rows:
+            permissions.setdefault(resource_id, []).append(json.loads(data))
+        return permissions
+
+    def save_permissions(self, permissions):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM permissions')
+            for resource_id, entries in permissions.items():
+                self.add_permission_rows(conn, resource_id, entries)
+            self._bump_acl_version(conn)
+
+    def load_groups(self):
+        rows = self._connection().execute('SELECT data FROM groups ORDER BY rowid')
+        return {'groups': [json.loads(data) for (data,) in rows]}
+
+    def save_groups(self, groups):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM groups')
+            conn.execute('DELETE FROM group_members')
+            for group in groups['groups']:
+                self.add_group_row(conn, group)
+            self._bump_acl_version(conn)
+
+    def load_user_groups(self, user_id):
+        rows = self._connection().execute(
+            'SELECT data FROM groups WHERE creator_id = ? OR id IN '
+            '(SELECT group_id FROM group_members WHERE member = ?) ORDER BY rowid',
+            (user_id, user_id)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def load_templates(self):
+        rows = self._connection().execute('SELECT data FROM templates ORDER BY id')
+        return {'templates': [json.loads(data) for (data,) in rows]}
+
+    def save_templates(self, templates):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM templates')
+            for template in templates['templates']:
+                self.add_template_row(conn, template)
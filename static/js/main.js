@@ -34,7 +34,7 @@ document.addEventListener("DOMContentLoaded", function () {
     const status = statusFilter.value;
 
     fetch(
-      `/filter_problems?search=${searchTerm}&category=${category}&status=${status}`
+      `/filter_problems?search=${searchTerm}&category=${category}&status=${status}&fields=title,category,description,status,due_date`
     )
       .then((response) => response.json())
       .then((problems) => {
@@ -387,6 +387,41 @@ document.addEventListener("DOMContentLoaded", function () {
     });
   }
 
+  // Exports run as background jobs: start one, poll it, then download
+  document.querySelectorAll("[data-export-format]").forEach((link) => {
+    link.addEventListener("click", function (e) {
+      e.preventDefault();
+      const formData = new FormData();
+      formData.append("format", this.dataset.exportFormat);
+
+      function poll(job) {
+        if (job.status === "done") {
+          window.location.href = `/export_jobs/${job.id}/download`;
+        } else if (job.status === "failed") {
+          alert("הייצוא נכשל: " + (job.error || ""));
+        } else {
+          setTimeout(() => {
+            fetch(`/export_jobs/${job.id}`)
+              .then((response) => response.json())
+              .then((data) => poll(data.job));
+          }, 1000);
+        }
+      }
+
+      fetch("/export_jobs", {
+        method: "POST",
+        body: formData,
+      })
+        .then((response) => response.json())
+        .then((data) => {
+          if (data.success) {
+            poll(data.job);
+          }
+        })
+        .catch((error) => console.error("Error:", error));
+    });
+  });
+
   // Call new functions
   if (document.querySelector(".kanban-container")) {
     initKanban();
@@ -0,0 +1,58 @@
+import threading
+from collections import Counter
+
+class ProblemStats:
+    """Live aggregates over all problems, kept current by store updates
+
+    The overdue count comes from the due date index, which caches it for
+    the current day, so reading the statistics costs O(1).
+    """
+
+    def __init__(self, store, due_index):
+        self.store = store
+        self.due_index = due_index
+        self._lock = threading.RLock()
+        self._clear()
+        store.add_listener(self)
+
+    def _clear(self):
+        self.total = 0
+        self.by_status = Counter()
+        self.by_category = Counter()
+        self.total_time = 0
+
+    def _count(self, problem, sign):
+        self.total += sign
+        self.total_time += sign * (problem.get('total_time', 0) or 0)
+        for counter, key in ((self.by_status, problem.get('status')),
+                             (self.by_category, problem.get('category'))):
+            counter[key] += sign
+            if counter[key] <= 0:
+                del counter[key]
+
+    def reset(self, problems):
+        with self._lock:
+            self._clear()
+            for problem in problems:
+                self._count(problem, 1)
+
+    def update(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._count(old, -1)
+            if new is not None:
+                self._count(new, 1)
+
+    def snapshot(self):
+        self.store.refresh()
+        overdue = self.due_index.overdue()
+        with self._lock:
+            total = self.total
+            return {
+                'total': total,
+                'by_status': dict(self.by_status),
+                'by_category': dict(self.by_category),
+                'overdue': overdue,
+                'total_time_spent': self.total_time,
+                'avg_time_per_problem': self.total_time / total if total > 0 else 0
+            }
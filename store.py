@@ -0,0 +1,508 @@
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from journal import MutationJournal, archive_path, complete_length
+
+PROBLEMS_FILE = os.path.join('data', 'problems.json')
+JOURNAL_FILE = os.path.join('data', 'problems_journal.ndjson')
+JOURNAL_ARCHIVE_FILE = archive_path(JOURNAL_FILE)
+LOCK_FILE = os.path.join('data', 'problems.lock')
+
+# 'json' (snapshot + journal files) or 'sqlite'
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+DATABASE_FILE = os.environ.get('DATABASE_FILE', os.path.join('data', 'problems.db'))
+
+# Days compacted journal records are kept in the archive (point-in-time
+# restore needs them back to the oldest backup)
+JOURNAL_ARCHIVE_DAYS = int(os.environ.get('JOURNAL_ARCHIVE_DAYS', 35))
+
+# The journal_seq member json.dump writes last into the snapshot file
+_SNAPSHOT_SEQ = re.compile(rb'"journal_seq":\s*(\d+)\s*}\s*$')
+
+# Sequence used for the ids of items appended to each problem list
+ITEM_SEQUENCES = {
+    'subtasks': 'subtask',
+    'comments': 'comment',
+    'solutions': 'solution',
+    'time_logs': 'time_log'
+}
+
+def activity_date(history=None):
+    """The last_activity timestamp of a mutation: its history date or now"""
+    if history and history.get('date'):
+        return history['date']
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def with_last_activity(problem):
+    """Set last_activity on a new problem from its newest history entry"""
+    if 'last_activity' not in problem:
+        history = problem.get('history') or [None]
+        problem['last_activity'] = activity_date(history[-1])
+    return problem
+
+def atomic_write_json(path, data, **kwargs):
+    """Replace a JSON file in one step, so readers see the old or the new version"""
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def affected_ids(ops):
+    """Ids of the problems touched by a list of journal operations"""
+    return list(dict.fromkeys(op['problem']['id'] if op['op'] == 'insert' else op['id'] for op in ops))
+
+class Dataset:
+    """The problems list plus an id index and monotonic id sequences
+
+    Sequences are persisted in the snapshot and only ever move forward, so
+    ids are never reused after a delete. Duplicate problem ids left by the
+    old len()+1 allocation are repaired on load.
+
+    Problems are copy-on-write: a change builds a new dict and swaps it in,
+    so readers iterating a problem (or holding it as the old state) never
+    see it change.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.problems = data['problems']
+        self.sequences = dict.fromkeys(['problem', *ITEM_SEQUENCES.values()], 0)
+        self.sequences.update(data.pop('sequences', {}))
+        self.index = {}
+        for problem in self.problems:
+            self._observe(problem)
+        for problem in self.problems:
+            if problem['id'] in self.index:
+                problem['id'] = self.allocate('problem')
+            self.index[problem['id']] = problem
+        self.positions = {problem['id']: i for i, problem in enumerate(self.problems)}
+
+    def _bump(self, name, value):
+        if isinstance(value, int) and value > self.sequences[name]:
+            self.sequences[name] = value
+
+    def _observe(self, problem):
+        self._bump('problem', problem['id'])
+        for field, name in ITEM_SEQUENCES.items():
+            for item in problem.get(field, []):
+                self._bump(name, item.get('id'))
+
+    def allocate(self, name):
+        """Hand out the next id of a sequence"""
+        self.sequences[name] += 1
+        return self.sequences[name]
+
+    def assign_ids(self, op):
+        """Fill in missing ids of a new problem or list item"""
+        if op['op'] == 'insert' and op['problem'].get('id') is None:
+            op['problem']['id'] = self.allocate('problem')
+        elif op['op'] == 'append':
+            name = ITEM_SEQUENCES.get(op['field'])
+            if name and op['item'].get('id') is None:
+                op['item']['id'] = self.allocate(name)
+
+    def apply(self, op):
+        """Apply a single journal operation"""
+        kind = op['op']
+        if kind == 'insert':
+            problem = op['problem']
+            self.positions[problem['id']] = len(self.problems)
+            self.problems.append(problem)
+            self.index[problem['id']] = problem
+            self._observe(problem)
+            return
+
+        problem = self.index.get(op['id'])
+        if problem is None:
+            return
+        if kind == 'delete':
+            del self.index[op['id']]
+            self.problems[:] = [p for p in self.problems if p is not problem]
+            self.positions = {p['id']: i for i, p in enumerate(self.problems)}
+            return
+        problem = dict(problem)
+        if kind == 'update':
+            problem.update(op['fields'])
+        elif kind == 'append':
+            problem[op['field']] = problem.get(op['field'], []) + [op['item']]
+            name = ITEM_SEQUENCES.get(op['field'])
+            if name:
+                self._bump(name, op['item'].get('id'))
+        elif kind == 'update_item':
+            problem[op['field']] = [dict(item, **op['fields']) if item['id'] == op['item_id'] else item
+                                    for item in problem.get(op['field'], [])]
+        self.index[op['id']] = problem
+        self.problems[self.positions[op['id']]] = problem
+
+    def snapshot(self, journal_seq):
+        """Return the JSON document to write as data/problems.json"""
+        return dict(self.data, sequences=self.sequences, journal_seq=journal_seq)
+
+class ProblemStore:
+    """Keeps the parsed problems dataset resident in memory
+
+    data/problems.json is a snapshot; every mutation after it is appended to
+    a journal (one NDJSON record per change) and replayed on load.
+    compact() periodically folds the journal back into the snapshot.
+    Changes written by other processes are picked up by tailing the
+    journal, or by a full reload when the snapshot itself is replaced.
+
+    In-memory indexes register with add_listener() to be kept in sync.
+    """
+
+    def __init__(self, path=PROBLEMS_FILE, journal_path=JOURNAL_FILE, lock_path=LOCK_FILE):
+        self.path = path
+        self.lock_path = lock_path
+        self.journal = MutationJournal(journal_path)
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._dataset = None
+        self._stamp = None
+        self._seq = 0
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._listeners = []
+        self._commit_hooks = []
+
+    @property
+    def version(self):
+        """Sequence number of the last applied mutation"""
+        return self._seq
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            return {'problems': []}
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def _reload(self):
+        while True:
+            stamp = self._file_stamp()
+            journal_stamp = self.journal.stamp()
+            data = self._read_snapshot()
+            self._seq = data.pop('journal_seq', 0)
+            self._dataset = Dataset(data)
+            self._journal_inode = journal_stamp[0] if journal_stamp else None
+            self._journal_offset = 0
+            self._replay(notify=False)
+            # A compaction may have swapped both files while we were reading
+            if self._file_stamp() == stamp:
+                self._stamp = stamp
+                break
+        for listener in self._listeners:
+            listener.reset(self._dataset.problems)
+
+    def _snapshot_seq(self):
+        """journal_seq of the snapshot file, read from its tail (None if not found)"""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(max(os.fstat(f.fileno()).st_size - 256, 0))
+                match = _SNAPSHOT_SEQ.search(f.read())
+        except FileNotFoundError:
+            return None
+        return int(match.group(1)) if match else None
+
+    def _rebase(self):
+        """Follow a compaction by another process without reloading
+
+        Compaction does not change the data: if the new snapshot is not ahead
+        of what we applied, only the journal position moves. Returns False
+        when a full reload is needed instead.
+        """
+        stamp = self._file_stamp()
+        seq = self._snapshot_seq()
+        if seq is None or seq > self._seq:
+            return False
+        journal_stamp = self.journal.stamp()
+        offset = 0
+        for record, end in self.journal.read(0):
+            if record['seq'] > self._seq + 1:
+                # Records between our position and the journal were compacted away
+                return False
+            if record['seq'] > self._seq:
+                self._apply(record)
+            offset = end
+        self._stamp = stamp
+        self._journal_inode = journal_stamp[0] if journal_stamp else None
+        self._journal_offset = offset
+        return True
+
+    def _replay(self, notify=True):
+        for record, offset in self.journal.read(self._journal_offset):
+            if record['seq'] > self._seq:
+                self._apply(record, notify)
+            self._journal_offset = offset
+
+    def _refresh(self):
+        if self._dataset is None:
+            self._reload()
+            return
+        if self._file_stamp() != self._stamp:
+            if not self._rebase():
+                self._reload()
+            return
+        journal_stamp = self.journal.stamp()
+        if journal_stamp is None:
+            if self._journal_offset:
+                self._reload()
+            return
+        inode, size = journal_stamp
+        if inode != self._journal_inode or size < self._journal_offset:
+            if not self._rebase():
+                self._reload()
+        elif size > self._journal_offset:
+            self._replay()
+
+    def _apply(self, record, notify=True, hooks=False):
+        notify = notify and self._listeners
+        hooks = hooks and self._commit_hooks
+        if notify or hooks:
+            ids = affected_ids(record['ops'])
+            # Changes replace the problem dicts, so the current ones stay as they are
+            old = {problem_id: self._dataset.index.get(problem_id) for problem_id in ids}
+        for op in record['ops']:
+            self._dataset.apply(op)
+        self._seq = record['seq']
+        if notify or hooks:
+            changes = [(old[problem_id], self._dataset.index.get(problem_id)) for problem_id in ids]
+        if notify:
+            for old_problem, new_problem in changes:
+                for listener in self._listeners:
+                    listener.update(old_problem, new_problem)
+        if hooks:
+            for hook in self._commit_hooks:
+                hook(changes)
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialize writers across threads and, where supported, processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            if self._lock_file is None:
+                self._lock_file = open(self.lock_path, 'a')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _current(self):
+        with self._lock:
+            self._refresh()
+            return self._dataset
+
+    def refresh(self):
+        """Catch up with changes made by other processes"""
+        self._current()
+
+    def add_listener(self, listener):
+        """Register an index kept in sync with the problems
+
+        listener.reset(problems) is called with the full dataset on every
+        (re)load and listener.update(old, new) after each change, with old
+        or new set to None for inserts and deletes.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if self._dataset is not None:
+                listener.reset(self._dataset.problems)
+
+    def add_commit_hook(self, hook):
+        """Register hook(changes), called for mutations committed by this process
+
+        changes is a list of (old, new) pairs as passed to listeners. The
+        hook runs while the writer lock is held, so hooks in different
+        processes are called one at a time and in commit order.
+        """
+        with self._lock:
+            self._commit_hooks.append(hook)
+
+    @contextmanager
+    def snapshot_files(self):
+        """Open a consistent point-in-time view of the store files without locking
+
+        Yields {filename: (file, length)}: the snapshot file and the complete
+        journal records present once both were opened. Compaction replaces
+        both files, so they are reopened until the snapshot file is the same
+        before and after opening the journal.
+        """
+        while True:
+            snapshot = open(self.path, 'rb')
+            try:
+                journal = open(self.journal.path, 'rb')
+            except FileNotFoundError:
+                journal = None
+            if os.stat(self.path).st_ino == os.fstat(snapshot.fileno()).st_ino:
+                break
+            snapshot.close()
+            if journal is not None:
+                journal.close()
+        try:
+            files = {os.path.basename(self.path): (snapshot, os.fstat(snapshot.fileno()).st_size)}
+            if journal is not None:
+                length = complete_length(journal, os.fstat(journal.fileno()).st_size)
+                journal.seek(0)
+                files[os.path.basename(self.journal.path)] = (journal, length)
+            yield files
+        finally:
+            snapshot.close()
+            if journal is not None:
+                journal.close()
+
+    def problems(self):
+        """Return the list of all problems (must not be mutated by callers)"""
+        return self._current().problems
+
+    def get(self, problem_id):
+        """Return a single problem or None"""
+        return self._current().index.get(problem_id)
+
+    def iter_problems(self, batch_size=1000):
+        """Yield all problems one at a time
+
+        The problems are already in memory, so this only guards against
+        the list changing while a long export is iterating it.
+        """
+        yield from list(self.problems())
+
+    def query(self, category=None, status=None, tags=None, owner_id=None, group_id=None,
+              created_from=None, due_from=None, due_to=None):
+        """Return problems matching all given filters (dates are YYYY-MM-DD strings)"""
+        problems = self.problems()
+        if category is not None:
+            problems = [p for p in problems if p['category'] == category]
+        if status is not None:
+            problems = [p for p in problems if p['status'] == status]
+        if owner_id is not None:
+            problems = [p for p in problems if p.get('owner_id') == owner_id]
+        if group_id is not None:
+            problems = [p for p in problems if p.get('group_id') == group_id]
+        if tags:
+            problems = [p for p in problems if all(tag in p.get('tags', []) for tag in tags)]
+        if created_from:
+            problems = [p for p in problems if p['created_date'] >= created_from]
+        if due_from:
+            problems = [p for p in problems if p['due_date'] >= due_from]
+        if due_to:
+            problems = [p for p in problems if p['due_date'] <= due_to]
+        return problems
+
+    def _commit(self, ops):
+        with self._exclusive():
+            self._refresh()
+            for op in ops:
+                self._dataset.assign_ids(op)
+            record = {
+                'seq': self._seq + 1,
+                'ts': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'ops': ops
+            }
+            self._journal_offset = self.journal.append(record)
+            self._journal_inode = self.journal.stamp()[0]
+            self._apply(record, hooks=True)
+
+    def _with_history(self, problem_id, ops, history, fields=None):
+        fields = {**(fields or {}), 'last_activity': activity_date(history)}
+        ops.append({'op': 'update', 'id': problem_id, 'fields': fields})
+        if history is not None:
+            ops.append({'op': 'append', 'id': problem_id, 'field': 'history', 'item': history})
+        self._commit(ops)
+
+    def insert(self, problem):
+        """Add a new problem, allocating its id if it has none"""
+        self._commit([{'op': 'insert', 'problem': with_last_activity(problem)}])
+        return problem
+
+    def delete(self, problem_id):
+        """Remove a problem"""
+        self._commit([{'op': 'delete', 'id': problem_id}])
+
+    def update(self, problem_id, fields, history=None):
+        """Set top-level fields of a problem, optionally recording a history entry"""
+        self._with_history(problem_id, [{'op': 'update', 'id': problem_id, 'fields': fields}], history)
+
+    def append(self, problem_id, field, item, history=None, fields=None):
+        """Append an item to one of a problem's lists (comments, subtasks...)
+
+        Items of the lists in ITEM_SEQUENCES get an id allocated. fields optionally sets top-level fields in the same journal record.
+        """
+        ops = [{'op': 'append', 'id': problem_id, 'field': field, 'item': item}]
+        self._with_history(problem_id, ops, history, fields)
+
+    def update_item(self, problem_id, field, item_id, fields, history=None):
+        """Update fields of an item inside one of a problem's lists"""
+        op = {'op': 'update_item', 'id': problem_id, 'field': field, 'item_id': item_id, 'fields': fields}
+        self._with_history(problem_id, [op], history)
+
+    def compact(self):
+        """Fold the journal into a new snapshot without blocking writers
+
+        The snapshot is rebuilt from the previous snapshot plus the journal
+        prefix seen when compaction started; only the short tail written in
+        the meantime is copied while holding the write lock.
+        """
+        with self._exclusive():
+            self._refresh()
+            base_stamp = self._stamp
+            upto = self._journal_offset
+        if not upto:
+            return False
+
+        data = self._read_snapshot()
+        seq = data.pop('journal_seq', 0)
+        dataset = Dataset(data)
+        for record, offset in self.journal.read(0):
+            if offset > upto:
+                break
+            if record['seq'] > seq:
+                for op in record['ops']:
+                    dataset.apply(op)
+                seq = record['seq']
+        tmp_path = self.path + '.compact'
+        with open(tmp_path, 'w') as f:
+            json.dump(dataset.snapshot(seq), f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self._exclusive():
+            if self._file_stamp() != base_stamp:
+                # Another process compacted first
+                os.remove(tmp_path)
+                return False
+            os.replace(tmp_path, self.path)
+            self.journal.truncate_head(upto)
+            self._stamp = self._file_stamp()
+            self._journal_inode = self.journal.stamp()[0]
+            self._journal_offset -= upto
+            # Whole days, so the archive is rewritten at most once a day
+            self.journal.prune_archive((date.today() - timedelta(days=JOURNAL_ARCHIVE_DAYS)).isoformat())
+        return True
+
+def create_store(backend=STORAGE_BACKEND):
+    """Create the problem store for the configured storage backend"""
+    if backend == 'sqlite':
+        from sqlite_store import SQLiteProblemStore
+        return SQLiteProblemStore(DATABASE_FILE)
+    return ProblemStore()
+
+problem_store = create_store()
@@ -0,0 +1,264 @@
+import heapq
+import math
+import threading
+from collections import Counter
+
+# How many of the most used tags every trie node remembers
+TOP_K = 20
+# Length of the substrings indexed for infix matches
+NGRAM = 2
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+def _problem_tags(problem):
+    if not problem:
+        return set()
+    return {tag.lower() for tag in problem.get('tags', [])}
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []
+
+class TagDictionary:
+    """Usage counts of all tags with a prefix trie and an n-gram index
+
+    Every trie node caches the TOP_K most used tags below it, so prefix
+    completion costs O(len(prefix)) whatever the vocabulary size. Tags that
+    contain the query elsewhere are found through the n-gram index.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._clear()
+        store.add_listener(self)
+
+    def _clear(self):
+        self._counts = Counter()
+        self._root = _Node()
+        self._ngrams = {}
+
+    def _rank(self, tag):
+        return (-self._counts[tag], tag)
+
+    def _path(self, tag):
+        nodes = [self._root]
+        for char in tag:
+            nodes.append(nodes[-1].children.setdefault(char, _Node()))
+        return nodes
+
+    def _refresh_path(self, tag):
+        """Recompute the cached top tags of every node on a tag's path"""
+        nodes = self._path(tag)
+        for depth in range(len(nodes) - 1, -1, -1):
+            node = nodes[depth]
+            candidates = set()
+            for child in node.children.values():
+                candidates.update(child.top)
+            prefix = tag[:depth]
+            if self._counts[prefix] > 0:
+                candidates.add(prefix)
+            node.top = sorted(candidates, key=self._rank)[:TOP_K]
+
+    def _change(self, tag, delta):
+        was_known = self._counts[tag] > 0
+        self._counts[tag] += delta
+        if self._counts[tag] <= 0:
+            del self._counts[tag]
+            for gram in _ngrams(tag):
+                tags = self._ngrams.get(gram)
+                if tags:
+                    tags.discard(tag)
+                    if not tags:
+                        del self._ngrams[gram]
+        elif not was_known:
+            for gram in _ngrams(tag):
+                self._ngrams.setdefault(gram, set()).add(tag)
+        self._refresh_path(tag)
+
+    def reset(self, problems):
+        with self._lock:
+            self._clear()
+            for problem in problems:
+                self._counts.update(_problem_tags(problem))
+            for tag in self._counts:
+                for gram in _ngrams(tag):
+                    self._ngrams.setdefault(gram, set()).add(tag)
+                node = self._root
+                for char in tag:
+                    node = node.children.setdefault(char, _Node())
+            self._build_tops(self._root, '')
+
+    def _build_tops(self, node, prefix):
+        candidates = set()
+        if self._counts[prefix] > 0:
+            candidates.add(prefix)
+        for char, child in node.children.items():
+            candidates.update(self._build_tops(child, prefix + char))
+        node.top = sorted(candidates, key=self._rank)[:TOP_K]
+        return node.top
+
+    def update(self, old, new):
+        old_tags, new_tags = _problem_tags(old), _problem_tags(new)
+        if old_tags == new_tags:
+            return
+        with self._lock:
+            for tag in old_tags - new_tags:
+                self._change(tag, -1)
+            for tag in new_tags - old_tags:
+                self._change(tag, 1)
+
+    def tags(self):
+        """All tags currently in use"""
+        self.store.refresh()
+        with self._lock:
+            return set(self._counts)
+
+    def autocomplete(self, query, limit=10):
+        """Return up to limit tags containing query, most used first
+
+        Tags starting with the query come before tags merely containing it;
+        infix matches need at least NGRAM characters.
+        """
+        query = query.lower()
+        limit = min(limit, TOP_K)
+        self.store.refresh()
+        with self._lock:
+            node = self._root
+            for char in query:
+                node = node.children.get(char)
+                if node is None:
+                    break
+            results = list(node.top[:limit]) if node is not None else []
+            if len(results) >= limit or len(query) < NGRAM:
+                return results
+
+            grams = sorted(_ngrams(query), key=lambda g: len(self._ngrams.get(g, ())))
+            candidates = set(self._ngrams.get(grams[0], ()))
+            for gram in grams[1:]:
+                candidates &= self._ngrams.get(gram, set())
+                if not candidates:
+                    break
+            seen = set(results)
+            infix = (tag for tag in candidates if query in tag and tag not in seen)
+            return results + heapq.nsmallest(limit - len(results), infix, key=self._rank)
+
+class TagCooccurrence:
+    """Sparse, incrementally updated matrix of how often two tags share a problem
+
+    Tags get integer ids; row i of the matrix is a dict {j: count} holding
+    only non-zero entries, and the diagonal (problems per tag) is kept in
+    a separate list. Updates touch only the rows of tags that changed, so
+    the cost is O(t²) in the tags of one problem, never in the vocabulary.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._clear()
+        store.add_listener(self)
+
+    def _clear(self):
+        self._ids = {}
+        self._tags = []
+        self._counts = []
+        self._rows = []
+        self._problems = 0
+
+    def _id(self, tag):
+        tag_id = self._ids.get(tag)
+        if tag_id is None:
+            tag_id = self._ids[tag] = len(self._tags)
+            self._tags.append(tag)
+            self._counts.append(0)
+            self._rows.append({})
+        return tag_id
+
+    def _add(self, tags, sign):
+        ids = sorted(self._id(tag) for tag in tags)
+        for i in ids:
+            self._counts[i] += sign
+        for n, i in enumerate(ids):
+            row_i = self._rows[i]
+            for j in ids[n + 1:]:
+                row_j = self._rows[j]
+                count = row_i.get(j, 0) + sign
+                if count > 0:
+                    row_i[j] = row_j[i] = count
+                else:
+                    row_i.pop(j, None)
+                    row_j.pop(i, None)
+
+    def reset(self, problems):
+        with self._lock:
+            self._clear()
+            for problem in problems:
+                self._problems += 1
+                self._add(_problem_tags(problem), 1)
+
+    def update(self, old, new):
+        with self._lock:
+            self._problems += (new is not None) - (old is not None)
+            old_tags, new_tags = _problem_tags(old), _problem_tags(new)
+            if old_tags != new_tags:
+                self._add(old_tags, -1)
+                self._add(new_tags, 1)
+
+    def count(self, a, b=None):
+        """Problems tagged a (and b, when given)"""
+        self.store.refresh()
+        with self._lock:
+            i = self._ids.get(a.lower())
+            if i is None:
+                return 0
+            if b is None:
+                return self._counts[i]
+            j = self._ids.get(b.lower())
+            return 0 if j is None else self._rows[i].get(j, 0)
+
+    def _scores(self, i, j, together):
+        expected = self._counts[i] * self._counts[j]
+        lift = together * self._problems / expected if expected else 0.0
+        return {'count': together, 'lift': lift, 'pmi': math.log2(lift) if lift > 0 else None}
+
+    def scores(self, a, b):
+        """{'count', 'lift', 'pmi'} of a tag pair
+
+        lift = P(a, b) / (P(a) P(b)); pmi is its base 2 logarithm (None
+        for tags that never co-occur).
+        """
+        self.store.refresh()
+        with self._lock:
+            i, j = self._ids.get(a.lower()), self._ids.get(b.lower())
+            if i is None or j is None:
+                return {'count': 0, 'lift': 0.0, 'pmi': None}
+            return self._scores(i, j, self._rows[i].get(j, 0))
+
+    def related(self, tag, k=10, by='count', min_count=1):
+        """The k tags most associated with tag, as [(tag, scores)]
+
+        by is 'count' or 'lift' (pmi ranks like lift); min_count drops
+        rare pairs, whose lift is noisy.
+        """
+        self.store.refresh()
+        with self._lock:
+            i = self._ids.get(tag.lower())
+            if i is None:
+                return []
+            candidates = ((self._tags[j], self._scores(i, j, together))
+                          for j, together in self._rows[i].items() if together >= min_count)
+            return heapq.nlargest(k, candidates, key=lambda item: (item[1][by], item[0]))
+
+    def pairs(self, k=None):
+        """Co-occurring tag pairs as [(tag_a, tag_b, count)] with tag_a < tag_b, most frequent first"""
+        self.store.refresh()
+        with self._lock:
+            pairs = (tuple(sorted((self._tags[i], self._tags[j]))) + (count,)
+                     for i, row in enumerate(self._rows) for j, count in row.items() if i < j)
+            if k is None:
+                return sorted(pairs, key=lambda pair: (-pair[2], pair[0], pair[1]))
+            return heapq.nsmallest(k, pairs, key=lambda pair: (-pair[2], pair[0], pair[1]))